@@ -0,0 +1,243 @@
+"""Benchmarks of the FreeCAD MCP server and bridge, without FreeCAD.
+
+Runs FreeCADMCPServer in this process against the stand-in FreeCAD,
+FreeCADGui and PySide modules in benchmarks/stubs, and drives it through
+freecad_bridge.send_to_freecad like the MCP tools do. Measures:
+
+- latency: sequential round trips of a trivial script
+- throughput: requests per second with many requests in flight
+- context: get_context (full and delta) for documents of 10 to 10,000 objects
+- payload: framing of large requests and responses
+
+The results, with the environment they were measured in, are written as
+JSON so runs can be compared over time:
+
+    python benchmarks/run_benchmarks.py --output results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIR = os.path.dirname(BENCHMARK_DIR)
+
+# Port the benchmark server listens on unless --port is given
+DEFAULT_PORT = 19876
+# Document sizes of the context benchmark
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+# Request and response sizes, in bytes, of the payload benchmark
+PAYLOAD_SIZES = (64 * 1024, 1024 * 1024, 16 * 1024 * 1024)
+
+def summarize(samples):
+    """Latency statistics, in seconds, of a list of samples"""
+    ordered = sorted(samples)
+
+    def percentile(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "mean": statistics.fmean(ordered),
+        "min": ordered[0],
+        "p50": percentile(0.5),
+        "p95": percentile(0.95),
+        "p99": percentile(0.99),
+        "max": ordered[-1]
+    }
+
+def check(response):
+    if response.get("status") != "success":
+        raise RuntimeError(f"FreeCAD returned an error: {response.get('message')}")
+    return response["result"]
+
+async def timed(bridge, command):
+    started = time.perf_counter()
+    response = await bridge.send_to_freecad(command)
+    elapsed = time.perf_counter() - started
+    check(response)
+    return elapsed, response
+
+async def bench_latency(bridge, iterations):
+    command = {"type": "run_script", "params": {"script": "pass"}}
+    for _ in range(min(iterations, 50)):
+        await timed(bridge, command)
+    samples = [(await timed(bridge, command))[0] for _ in range(iterations)]
+    return summarize(samples)
+
+async def bench_throughput(bridge, requests, concurrency):
+    command = {"type": "run_script", "params": {"script": "pass"}}
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            await timed(bridge, command)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "requests_per_second": requests / elapsed
+    }
+
+def build_document(name, size):
+    import FreeCAD as App
+    doc = App.newDocument(name)
+    for i in range(size):
+        box = doc.addObject("Part::Box", f"Box{i}")
+        box.Placement = App.Placement(App.Vector(i, 0, 0))
+    doc.recompute()
+
+async def bench_context(bridge, QtCore, sizes, iterations):
+    results = []
+    for size in sizes:
+        QtCore.call_in_event_loop(build_document, f"Bench{size}", size)
+        full = []
+        for _ in range(iterations):
+            elapsed, response = await timed(bridge, {"type": "get_context", "params": {}})
+            full.append(elapsed)
+        context = response["result"]
+        if len(context["objects"]) != size:
+            raise RuntimeError(f"Expected {size} objects, got {len(context['objects'])}")
+        payload = len(json.dumps(response))
+        # One object changes between delta requests
+        delta = []
+        script = "doc.getObject('Box0').Label = 'Changed'"
+        for _ in range(iterations):
+            revision = (await bridge.send_to_freecad({"type": "get_context", "params": {"since": context["revision"]}}))
+            check(revision)
+            await bridge.send_to_freecad({"type": "run_script", "params": {"script": script}})
+            elapsed, response = await timed(bridge, {"type": "get_context", "params": {"since": revision["result"]["revision"]}})
+            delta.append(elapsed)
+        results.append({
+            "objects": size,
+            "full": summarize(full),
+            "full_bytes": payload,
+            "delta": summarize(delta),
+            "delta_bytes": len(json.dumps(response))
+        })
+    return results
+
+async def bench_payload(bridge, sizes, iterations):
+    check(await bridge.send_to_freecad({
+        "type": "register_function",
+        "params": {"name": "blob", "source": "def blob(size):\n    return 'x' * size\n"}
+    }))
+    results = []
+    for size in sizes:
+        # Request: a script carrying a string literal of the given size
+        request = {"type": "run_script", "params": {"script": "data = '" + "x" * size + "'"}}
+        sent = [(await timed(bridge, request))[0] for _ in range(iterations)]
+        response = {"type": "call_function", "params": {"name": "blob", "args": [size]}}
+        received = [(await timed(bridge, response))[0] for _ in range(iterations)]
+        results.append({
+            "bytes": size,
+            "request": summarize(sent),
+            "request_mb_per_second": size / statistics.median(sent) / 1e6,
+            "response": summarize(received),
+            "response_mb_per_second": size / statistics.median(received) / 1e6
+        })
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPOSITORY_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def run(args, bridge, QtCore):
+    results = {}
+    benchmarks = (
+        ("latency", lambda: bench_latency(bridge, args.iterations * 10)),
+        ("throughput", lambda: bench_throughput(bridge, args.iterations * 50, args.concurrency)),
+        ("context", lambda: bench_context(bridge, QtCore, args.sizes, args.iterations)),
+        ("payload", lambda: bench_payload(bridge, PAYLOAD_SIZES, args.iterations))
+    )
+    for name, benchmark in benchmarks:
+        if args.only and name not in args.only:
+            continue
+        print(f"Running {name} benchmark...", file=sys.stderr)
+        results[name] = await benchmark()
+    results["server_metrics"] = check(await bridge.send_to_freecad({"type": "get_metrics"}))
+    await bridge.get_connection().close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="Write the results to this JSON file instead of stdout")
+    parser.add_argument("--transport", choices=("tcp", "unix"), default="tcp",
+                        help="Connect over TCP or a Unix domain socket")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="TCP port of the benchmark server")
+    parser.add_argument("--iterations", type=int, default=20, help="Repetitions of each measurement")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight in the throughput benchmark")
+    parser.add_argument("--sizes", type=lambda value: [int(size) for size in value.split(",")],
+                        default=list(DEFAULT_SIZES), help="Comma-separated document sizes of the context benchmark")
+    parser.add_argument("--only", nargs="+", choices=("latency", "throughput", "context", "payload"),
+                        help="Run only these benchmarks")
+    parser.add_argument("--compression", choices=("auto", "always", "never"), default="auto",
+                        help="Frame compression requested by the bridge")
+    args = parser.parse_args()
+
+    # Both modules read their configuration from the environment on import
+    os.environ["FREECAD_HOST"] = "localhost"
+    os.environ["FREECAD_PORT"] = str(args.port)
+    os.environ["FREECAD_MCP_COMPRESSION"] = args.compression
+    socket_dir = None
+    if args.transport == "unix":
+        socket_dir = tempfile.mkdtemp(prefix="fcmcp-bench-")
+        os.environ["FREECAD_MCP_SOCKET"] = os.path.join(socket_dir, "server.sock")
+    else:
+        os.environ.pop("FREECAD_MCP_SOCKET", None)
+    sys.path[:0] = [os.path.join(BENCHMARK_DIR, "stubs"), REPOSITORY_DIR, os.path.join(REPOSITORY_DIR, "src")]
+
+    from PySide import QtCore
+    import freecad_mcp
+    import freecad_bridge
+
+    QtCore.start_event_loop()
+    server = freecad_mcp.FreeCADMCPServer()
+    QtCore.call_in_event_loop(server.start)
+    if not server.running:
+        sys.exit("Could not start the benchmark server")
+    try:
+        results = asyncio.run(run(args, freecad_bridge, QtCore))
+    finally:
+        QtCore.call_in_event_loop(server.stop)
+        if socket_dir:
+            os.rmdir(socket_dir)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "transport": args.transport,
+            "compression": args.compression,
+            "iterations": args.iterations,
+            "concurrency": args.concurrency,
+            "sizes": args.sizes
+        },
+        "results": results
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""Stand-in for the FreeCAD module, used by the benchmarks.
+
+Implements just enough of the document model for FreeCADMCPServer:
+documents with objects, placements and shapes, document observers,
+recompute and transactions. Geometry is faked: every shape is a cube.
+"""
+import sys
+
+class _Console:
+    """Console that only prints errors and warnings, or everything when verbose"""
+
+    verbose = False
+
+    def PrintMessage(self, message):
+        if self.verbose:
+            sys.stderr.write(message)
+
+    def PrintLog(self, message):
+        pass
+
+    def PrintWarning(self, message):
+        sys.stderr.write("Warning: " + message)
+
+    def PrintError(self, message):
+        sys.stderr.write("Error: " + message)
+
+Console = _Console()
+
+class Vector:
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x, self.y, self.z = float(x), float(y), float(z)
+
+    def __iter__(self):
+        return iter((self.x, self.y, self.z))
+
+class Rotation:
+    def __init__(self, axis=None, angle=0.0, *quaternion):
+        if quaternion:
+            # Rotation(x, y, z, w)
+            self.Axis = Vector(0, 0, 1)
+            self.Angle = 0.0
+            self.Q = (axis, angle) + quaternion
+        else:
+            self.Axis = axis or Vector(0, 0, 1)
+            self.Angle = angle
+            self.Q = (0.0, 0.0, 0.0, 1.0)
+
+class Placement:
+    def __init__(self, base=None, rotation=None):
+        self.Base = base or Vector()
+        self.Rotation = rotation or Rotation()
+
+class BoundBox:
+    def __init__(self, *bounds):
+        self.XMin, self.YMin, self.ZMin, self.XMax, self.YMax, self.ZMax = bounds or (0.0,) * 6
+
+class Shape:
+    """Cube of the given edge length"""
+
+    ShapeType = "Solid"
+
+    def __init__(self, size=1.0):
+        self.size = size
+
+    @property
+    def Volume(self):
+        return self.size ** 3
+
+    @property
+    def Area(self):
+        return 6 * self.size ** 2
+
+    @property
+    def BoundBox(self):
+        return BoundBox(0, 0, 0, self.size, self.size, self.size)
+
+    @property
+    def CenterOfMass(self):
+        half = self.size / 2
+        return Vector(half, half, half)
+
+    def isNull(self):
+        return False
+
+    def tessellate(self, tolerance):
+        s = self.size
+        points = [Vector(0, 0, 0), Vector(s, 0, 0), Vector(0, s, 0), Vector(0, 0, s)]
+        return points, [(0, 1, 2), (0, 1, 3), (0, 2, 3), (1, 2, 3)]
+
+    def exportBrepToString(self):
+        return f"BREP {self.size!r}"
+
+    def importBrepFromString(self, brep):
+        self.size = float(brep.split()[1])
+
+    def fuse(self, tools):
+        return Shape((self.size ** 3 + sum(t.size ** 3 for t in tools)) ** (1 / 3))
+
+    def cut(self, tools):
+        return Shape(max(self.size ** 3 - sum(t.size ** 3 for t in tools), 0) ** (1 / 3))
+
+    def common(self, tools):
+        return Shape(min([self.size] + [t.size for t in tools]))
+
+    def removeSplitter(self):
+        return self
+
+class ViewObject:
+    Visibility = True
+
+# Attributes that are bookkeeping rather than document properties
+_INTERNAL = {"Document", "TypeId", "Name", "ViewObject", "InList", "OutList", "_touched"}
+
+class DocumentObject:
+    _touched = True
+
+    def __init__(self, document, type_id, name):
+        object.__setattr__(self, "Document", document)
+        object.__setattr__(self, "TypeId", type_id)
+        object.__setattr__(self, "Name", name)
+        object.__setattr__(self, "ViewObject", ViewObject())
+        object.__setattr__(self, "InList", [])
+        object.__setattr__(self, "OutList", [])
+        object.__setattr__(self, "Label", name)
+        object.__setattr__(self, "Placement", Placement())
+        if type_id.startswith("Part::"):
+            object.__setattr__(self, "Shape", Shape())
+
+    def __setattr__(self, name, value):
+        if name == "Length" and value < 0:
+            raise ValueError("Length must be positive")
+        object.__setattr__(self, name, value)
+        if name not in _INTERNAL:
+            object.__setattr__(self, "_touched", True)
+            self.Document._changed(self, name)
+
+    @property
+    def State(self):
+        return ["Touched"] if self._touched else []
+
+    @property
+    def InListRecursive(self):
+        found, pending = {}, list(self.InList)
+        while pending:
+            obj = pending.pop()
+            if obj.Name not in found:
+                found[obj.Name] = obj
+                pending.extend(obj.InList)
+        return list(found.values())
+
+    @property
+    def PropertiesList(self):
+        return [name for name in self.__dict__ if name[0].isupper() and name not in _INTERNAL]
+
+    def isTouched(self):
+        return self._touched
+
+    def touch(self):
+        object.__setattr__(self, "_touched", True)
+        self.Document._changed(self, "Label")
+
+    def getPropertyByName(self, name):
+        return getattr(self, name)
+
+_observers = []
+
+def addDocumentObserver(observer):
+    _observers.append(observer)
+
+def removeDocumentObserver(observer):
+    if observer in _observers:
+        _observers.remove(observer)
+
+def _notify(slot, *args):
+    for observer in list(_observers):
+        callback = getattr(observer, slot, None)
+        if callback:
+            callback(*args)
+
+class Document:
+    def __init__(self, name):
+        self.Name = name
+        self.Label = name
+        self.FileName = ""
+        self._objects = {}
+        self._transaction = None
+
+    @property
+    def Objects(self):
+        return list(self._objects.values())
+
+    def addObject(self, type_id, name=None):
+        base = name = name or type_id.split("::")[-1]
+        counter = 0
+        while name in self._objects:
+            counter += 1
+            name = "%s%03d" % (base, counter)
+        obj = DocumentObject(self, type_id, name)
+        self._objects[name] = obj
+        _notify("slotCreatedObject", obj)
+        return obj
+
+    def removeObject(self, name):
+        obj = self._objects.get(name)
+        if obj is not None:
+            _notify("slotDeletedObject", obj)
+            del self._objects[name]
+
+    def getObject(self, name):
+        return self._objects.get(name)
+
+    def getObjectsByLabel(self, label):
+        return [obj for obj in self._objects.values() if obj.Label == label]
+
+    def _changed(self, obj, prop):
+        if obj.Name in self._objects:
+            _notify("slotChangedObject", obj, prop)
+
+    def recompute(self, objects=None, *args):
+        objects = self.Objects if objects is None else objects
+        for obj in objects:
+            object.__setattr__(obj, "_touched", False)
+            _notify("slotRecomputedObject", obj)
+        _notify("slotRecomputedDocument", self)
+        return len(objects)
+
+    def openTransaction(self, name=""):
+        self._transaction = name
+
+    def commitTransaction(self):
+        self._transaction = None
+
+    def abortTransaction(self):
+        self._transaction = None
+
+    def transactionName(self):
+        return self._transaction
+
+_documents = {}
+ActiveDocument = None
+
+def newDocument(name="Unnamed"):
+    global ActiveDocument
+    document = _documents[name] = Document(name)
+    ActiveDocument = document
+    _notify("slotCreatedDocument", document)
+    return document
+
+def activeDocument():
+    return ActiveDocument
+
+def getDocument(name):
+    return _documents[name]
+
+def listDocuments():
+    return dict(_documents)
+
+def closeDocument(name):
+    global ActiveDocument
+    document = _documents.pop(name)
+    _notify("slotDeletedDocument", document)
+    if ActiveDocument is document:
+        ActiveDocument = None
+
+def getHomePath():
+    return "/nonexistent/"
+
+def getUserAppDataDir():
+    return "/tmp/"
+
+def Version():
+    return ["0", "21", "0"]
@@ -0,0 +1,9 @@
+"""Stand-in for the FreeCADGui module, used by the benchmarks: there is no GUI document"""
+
+ActiveDocument = None
+
+class _Control:
+    def showDialog(self, panel):
+        pass
+
+Control = _Control()
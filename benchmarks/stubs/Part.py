@@ -0,0 +1,2 @@
+"""Stand-in for the Part module, used by the benchmarks"""
+from FreeCAD import Shape
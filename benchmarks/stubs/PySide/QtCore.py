@@ -0,0 +1,166 @@
+"""Minimal QtCore event loop for running FreeCADMCPServer without Qt.
+
+QSocketNotifier and QTimer.singleShot are backed by a selector loop.
+Start it with start_event_loop(); like the Qt GUI thread, the loop runs
+every notifier and timer callback on one thread, so code touching the
+server or the fake documents from elsewhere must go through
+call_in_event_loop().
+"""
+import heapq
+import itertools
+import selectors
+import socket
+import threading
+import time
+
+class _EventLoop:
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.notifiers = {}
+        self.timers = []
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ, None)
+        self.thread = None
+
+    def call_later(self, delay, callback):
+        with self.lock:
+            heapq.heappush(self.timers, (time.monotonic() + delay, next(self.sequence), callback))
+        if threading.current_thread() is not self.thread:
+            self.wakeup_writer.send(b"\0")
+
+    def update(self, fd):
+        """Register fd for the events its enabled notifiers wait for"""
+        events = 0
+        for notifier in self.notifiers.get(fd, ()):
+            if notifier.enabled:
+                events |= selectors.EVENT_READ if notifier.kind == QSocketNotifier.Read else selectors.EVENT_WRITE
+        try:
+            self.selector.unregister(fd)
+        except (KeyError, ValueError):
+            pass
+        if events:
+            self.selector.register(fd, events, fd)
+
+    def run(self):
+        self.thread = threading.current_thread()
+        while True:
+            with self.lock:
+                timeout = max(0.0, self.timers[0][0] - time.monotonic()) if self.timers else None
+            for key, mask in self.selector.select(timeout):
+                if key.data is None:
+                    try:
+                        self.wakeup_reader.recv(4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                for notifier in list(self.notifiers.get(key.data, ())):
+                    wanted = selectors.EVENT_READ if notifier.kind == QSocketNotifier.Read else selectors.EVENT_WRITE
+                    if notifier.enabled and mask & wanted:
+                        notifier.activated.emit(key.data)
+            now = time.monotonic()
+            while True:
+                with self.lock:
+                    if not self.timers or self.timers[0][0] > now:
+                        break
+                    _, _, callback = heapq.heappop(self.timers)
+                callback()
+
+_loop = _EventLoop()
+
+def start_event_loop():
+    """Run the event loop in a daemon thread"""
+    thread = threading.Thread(target=_loop.run, name="qt-event-loop", daemon=True)
+    thread.start()
+    while _loop.thread is None:
+        time.sleep(0.001)
+    return thread
+
+def call_in_event_loop(function, *args):
+    """Call function on the event loop thread and return its result"""
+    done = threading.Event()
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = function(*args)
+        except BaseException as e:
+            outcome["error"] = e
+        done.set()
+
+    _loop.call_later(0, run)
+    done.wait()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome.get("result")
+
+class _BoundSignal:
+    def __init__(self):
+        self.slots = []
+
+    def connect(self, slot):
+        self.slots.append(slot)
+
+    def disconnect(self, slot=None):
+        self.slots = [] if slot is None else [s for s in self.slots if s != slot]
+
+    def emit(self, *args):
+        for slot in list(self.slots):
+            slot(*args)
+
+class Signal:
+    def __set_name__(self, owner, name):
+        self.attribute = "_signal_" + name
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        return obj.__dict__.setdefault(self.attribute, _BoundSignal())
+
+class QObject:
+    def __init__(self, parent=None):
+        pass
+
+    def deleteLater(self):
+        pass
+
+class QTimer(QObject):
+    @staticmethod
+    def singleShot(msec, callback):
+        _loop.call_later(msec / 1000.0, callback)
+
+class QSocketNotifier(QObject):
+    Read = 0
+    Write = 1
+    Exception = 2
+
+    activated = Signal()
+
+    def __init__(self, fd, kind, parent=None):
+        self.fd = fd if isinstance(fd, int) else fd.fileno()
+        self.kind = kind
+        self.enabled = True
+        _loop.notifiers.setdefault(self.fd, []).append(self)
+        _loop.update(self.fd)
+
+    def isEnabled(self):
+        return self.enabled
+
+    def setEnabled(self, enabled):
+        if self.enabled != enabled:
+            self.enabled = enabled
+            if self in _loop.notifiers.get(self.fd, ()):
+                _loop.update(self.fd)
+
+    def socket(self):
+        return self.fd
+
+    def deleteLater(self):
+        notifiers = _loop.notifiers.get(self.fd, [])
+        if self in notifiers:
+            notifiers.remove(self)
+            if not notifiers:
+                del _loop.notifiers[self.fd]
+            _loop.update(self.fd)
@@ -0,0 +1,30 @@
+"""Placeholders for the QtGui widgets of the task panel"""
+
+class QWidget:
+    def __init__(self, *args):
+        pass
+
+class QLabel(QWidget):
+    def setText(self, text):
+        pass
+
+class QPushButton(QWidget):
+    def __init__(self, *args):
+        self.clicked = _Clicked()
+
+    def setEnabled(self, enabled):
+        pass
+
+class _Clicked:
+    def connect(self, slot):
+        pass
+
+class QVBoxLayout(QWidget):
+    def addWidget(self, widget):
+        pass
+
+    def addLayout(self, layout):
+        pass
+
+class QHBoxLayout(QVBoxLayout):
+    pass
@@ -0,0 +1,6 @@
+"""Stand-in for PySide, used by the benchmarks.
+
+QtCore implements the socket notifiers and single-shot timers the server
+uses on top of a selector loop running in its own thread; QtGui only
+provides placeholders for the task panel classes.
+"""
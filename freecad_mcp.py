@@ -1,104 +1,2101 @@
 import os
 import FreeCAD as App
 import FreeCADGui as Gui
+import array
+import base64
+import bisect
+import collections
+import contextlib
+import cProfile
+import errno
+import fnmatch
+import hashlib
+import inspect
+import itertools
 import json
+import marshal
+import pstats
+import queue
+import re
+import shutil
 import socket
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
 import threading
 import time
 import traceback
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from PySide import QtCore, QtGui
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Where the server listens. With a socket path, a Unix domain socket is
+# used and TCP only serves as the fallback when it cannot be created.
+SERVER_HOST = os.environ.get("FREECAD_HOST", "localhost")
+SERVER_PORT = int(os.environ.get("FREECAD_PORT", "9876"))
+SERVER_SOCKET = os.environ.get("FREECAD_MCP_SOCKET")
+# Port of the optional Prometheus metrics endpoint, disabled when unset
+METRICS_PORT = int(os.environ["FREECAD_MCP_METRICS_PORT"]) if os.environ.get("FREECAD_MCP_METRICS_PORT") else None
+
+# Wire protocol. Every message is a frame made of a fixed header
+# (magic, protocol version, flags, payload length) followed by a UTF-8
+# JSON payload. Large messages are split over several frames, all but
+# the last one flagged with FLAG_MORE. Clients that send bare JSON
+# documents are still served in legacy mode. Keep in sync with
+# src/freecad_bridge.py.
+PROTOCOL_MAGIC = b'FCMP'
+PROTOCOL_VERSION = 1
+FRAME_HEADER = struct.Struct('!4sBBI')
+FLAG_MORE = 0x01
+MAX_FRAME_SIZE = 512 * 1024 * 1024
+RECV_CHUNK_SIZE = 65536
+# Set on the frames of a message whose payload is a JSON_LENGTH prefix,
+# the JSON document and the raw bytes of the packed arrays it references.
+# Only sent to clients that announced the "binary" capability in hello.
+FLAG_BINARY = 0x02
+JSON_LENGTH = struct.Struct('!I')
+# Frame payloads compressed with zlib or zstd, negotiated in hello as the
+# "zlib" or "zstd" capability. Only frames of at least COMPRESS_THRESHOLD
+# bytes are compressed, and only when that makes them smaller.
+FLAG_ZLIB = 0x04
+FLAG_ZSTD = 0x08
+COMPRESS_THRESHOLD = 4096
+ZLIB_LEVEL = 1
+ZSTD_LEVEL = 3
+# Optional protocol features a client can ask for in hello
+SERVER_CAPABILITIES = {"binary", "shm", "zlib"} | ({"zstd"} if zstandard else set())
+# With the "shm" capability, packed arrays of at least this many bytes are
+# written to a shared memory file and only its path is sent. Clients
+# release the files with release_buffers; unreleased ones are removed
+# after SHARED_BUFFER_TTL seconds.
+SHM_THRESHOLD = 1024 * 1024
+SHARED_BUFFER_TTL = 60.0
+# Shortest wait between expiry checks, for files that could not be removed yet
+SHARED_BUFFER_RETRY = 1.0
+SHARED_BUFFER_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+# array typecodes of the dtypes used in packed arrays
+ARRAY_TYPECODES = {"<f8": "d", "<f4": "f", "<u4": "I", "<i4": "i", "|u1": "B"}
+# Largest frame payload sent; bigger responses are streamed in chunks
+STREAM_CHUNK_SIZE = 256 * 1024
+# Longest time spent writing to one client before yielding to the Qt event loop
+WRITE_TIME_SLICE = 0.01
+
+# Commands that never modify the document. They are served before
+# queued commands of other clients. The bridge keeps the same list.
+READ_ONLY_COMMANDS = {"hello", "get_context", "get_cache_stats", "list_sessions", "get_job", "list_jobs",
+                      "bulk_query", "release_buffers", "get_metrics"}
+# Longest time the command queue runs before yielding to the Qt event loop
+DRAIN_TIME_SLICE = 0.02
+LISTEN_BACKLOG = 16
+# Number of deleted-object records kept per document for delta contexts
+MAX_TOMBSTONES = 10000
+# Number of objects whose derived shape properties are cached
+SHAPE_CACHE_SIZE = 4096
+# Memory budget of the tessellation cache, in bytes of vertex and index data
+TESSELLATION_CACHE_BYTES = 256 * 1024 * 1024
+# Number of compiled scripts kept by CodeCache
+CODE_CACHE_SIZE = 256
+# Script sessions idle for longer than this many seconds are dropped
+SESSION_IDLE_TIMEOUT = 30 * 60
+MAX_SESSIONS = 32
+# Longest time a background job runs before yielding to the Qt event loop
+JOB_TIME_SLICE = 0.05
+# Number of finished jobs whose results are kept
+MAX_FINISHED_JOBS = 100
+# Headless FreeCADCmd processes used by the compute command. The worker
+# executable can be overridden with the FREECAD_MCP_WORKER variable.
+COMPUTE_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "freecad_mcp_worker.py")
+# Prefix of reply lines written by the worker, see freecad_mcp_worker.py
+WORKER_MARKER = "FCMP-WORKER "
+# Columns a bulk_query can return, with the number of values per object
+BULK_FIELDS = {"position": 3, "rotation": 4, "bbox": 6, "center_of_mass": 3, "volume": 1, "area": 1}
+# Per-object status codes returned by bulk_update
+UPDATE_OK = 0
+UPDATE_NOT_FOUND = 1
+UPDATE_FAILED = 2
+# Number of per-object error messages a bulk_update reports
+MAX_UPDATE_ERRORS = 100
+# Upper bounds, in seconds, of the buckets of the phase timing histograms
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf"))
+# Phases of a request, in order, timed per command
+PHASES = ("queue", "decode", "exec", "context", "encode", "send")
+# Hot functions listed in a script profile by default
+PROFILE_TOP_FUNCTIONS = 20
+# Profile entries of C functions from these FreeCAD modules count as native
+# (FreeCAD and OpenCASCADE) time rather than Python time
+PROFILE_NATIVE_PATTERN = re.compile(
+    r"^<(?:built-in method |method '\w+' of ')"
+    r"(?:App|Base|FreeCAD|FreeCADGui|Gui|Part|Mesh|MeshPart|Sketcher|PartDesign|Import|Draft|TechDraw|Fem|Path)\.")
+# Object fields a context can be projected to; "name" is always included
+OBJECT_FIELDS = ("name", "label", "type", "visibility", "placement", "shape")
+
+class ProtocolError(Exception):
+    """Raised when a client sends data that violates the wire protocol"""
+
+def encode_frame(payload, flags=0):
+    """Prefix a payload with a frame header"""
+    return FRAME_HEADER.pack(PROTOCOL_MAGIC, PROTOCOL_VERSION, flags, len(payload)) + payload
+
+def compress_frame(payload, compression):
+    """Compress a frame payload; returns the data to send and its flag"""
+    if compression is None or len(payload) < COMPRESS_THRESHOLD:
+        return payload, 0
+    if compression == "zstd":
+        data, flag = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(payload), FLAG_ZSTD
+    else:
+        data, flag = zlib.compress(payload, ZLIB_LEVEL), FLAG_ZLIB
+    if len(data) >= len(payload):
+        return payload, 0
+    return data, flag
+
+def decompress_frame(payload, flags):
+    """Undo compress_frame, refusing payloads that expand beyond MAX_FRAME_SIZE"""
+    if flags & FLAG_ZSTD:
+        if zstandard is None:
+            raise ProtocolError("zstd frame received but zstandard is not installed")
+        try:
+            return zstandard.ZstdDecompressor().decompress(payload, max_output_size=MAX_FRAME_SIZE)
+        except zstandard.ZstdError as e:
+            raise ProtocolError(f"Bad zstd frame: {e}")
+    if flags & FLAG_ZLIB:
+        decompressor = zlib.decompressobj()
+        try:
+            data = decompressor.decompress(payload, MAX_FRAME_SIZE)
+        except zlib.error as e:
+            raise ProtocolError(f"Bad zlib frame: {e}")
+        if decompressor.unconsumed_tail:
+            raise ProtocolError("Compressed frame too large")
+        return data
+    return payload
+
+class PackedArray:
+    """A numeric array sent as raw bytes instead of a list of JSON numbers.
+
+    It is serialized as {"__ndarray__": {"dtype", "shape", ...}}, with the
+    bytes either attached to a FLAG_BINARY message or inlined as base64
+    "data" for clients without the binary capability. Data is little endian.
+    """
+
+    def __init__(self, values, dtype="<f8", shape=None):
+        data = array.array(ARRAY_TYPECODES[dtype], values)
+        if sys.byteorder == "big":
+            data.byteswap()
+        self.data = data.tobytes()
+        self.dtype = dtype
+        self.shape = list(shape) if shape is not None else [len(data)]
+
+    def __len__(self):
+        return len(self.data)
+
+class SharedBufferPool:
+    """Files in shared memory holding the large arrays of responses.
+
+    A client on the same host maps the file instead of receiving the bytes
+    over the socket. Plain files are used rather than
+    multiprocessing.shared_memory, whose resource tracker would start a
+    process from sys.executable, i.e. FreeCAD itself. While files are open,
+    a timer removes the ones that were not released within ttl seconds.
+    """
+
+    def __init__(self, directory=SHARED_BUFFER_DIR, ttl=SHARED_BUFFER_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        self.buffers = {}
+        self.expiry_scheduled = False
+        self.created = 0
+        self.released = 0
+        self.expired = 0
+
+    def create(self):
+        """Create an empty shared buffer file and return its path"""
+        self.expire()
+        fd, path = tempfile.mkstemp(prefix="fcmcp-", dir=self.directory)
+        os.close(fd)
+        self.buffers[path] = time.monotonic()
+        self.created += 1
+        self._schedule_expiry()
+        return path
+
+    def release(self, paths):
+        released = 0
+        for path in paths:
+            if path in self.buffers and self._remove(path):
+                released += 1
+        self.released += released
+        return released
+
+    def expire(self):
+        deadline = time.monotonic() - self.ttl
+        for path in [path for path, created in self.buffers.items() if created < deadline]:
+            if self._remove(path):
+                self.expired += 1
+
+    def _schedule_expiry(self):
+        if self.buffers and not self.expiry_scheduled:
+            self.expiry_scheduled = True
+            oldest = next(iter(self.buffers.values()))
+            delay = max(oldest + self.ttl - time.monotonic(), SHARED_BUFFER_RETRY)
+            QtCore.QTimer.singleShot(int(delay * 1000), self._on_expiry_timer)
+
+    def _on_expiry_timer(self):
+        self.expiry_scheduled = False
+        self.expire()
+        self._schedule_expiry()
+
+    def clear(self):
+        for path in list(self.buffers):
+            self._remove(path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            # Still mapped by a client on Windows; retried when it expires.
+            return False
+        del self.buffers[path]
+        return True
+
+    def stats(self):
+        return {
+            "open": len(self.buffers),
+            "bytes": sum(os.path.getsize(path) for path in self.buffers if os.path.exists(path)),
+            "created": self.created,
+            "released": self.released,
+            "expired": self.expired
+        }
+
+def unpack_array(info, attachments=None):
+    """Decode a packed array sent by a client into a flat array.array"""
+    typecode = ARRAY_TYPECODES.get(info.get("dtype"))
+    if typecode is None:
+        raise ProtocolError(f"Unsupported array dtype: {info.get('dtype')}")
+    if "data" in info:
+        data = base64.b64decode(info["data"])
+    elif attachments is not None:
+        data = attachments[info["offset"]:info["offset"] + info["nbytes"]]
+    else:
+        raise ProtocolError("Packed array without data")
+    values = array.array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+def decode_payload(payload, flags=0):
+    """Parse a request payload, decoding the packed arrays it contains"""
+    attachments = None
+    if flags & FLAG_BINARY:
+        (length,) = JSON_LENGTH.unpack_from(payload)
+        attachments = payload[JSON_LENGTH.size + length:]
+        payload = payload[JSON_LENGTH.size:JSON_LENGTH.size + length]
+    if b'__ndarray__' not in payload:
+        return json.loads(payload.decode('utf-8'))
+
+    def object_hook(value):
+        if "__ndarray__" in value:
+            return unpack_array(value["__ndarray__"], attachments)
+        return value
+    return json.loads(payload.decode('utf-8'), object_hook=object_hook)
+
+def page_argument(value, name, minimum):
+    """Parse a context cursor or limit, given as an integer or a numeric string"""
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"{name} must be an integer, got {value!r}")
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer, got {value!r}")
+    if number < minimum:
+        raise ValueError(f"{name} must be at least {minimum}, got {number}")
+    return number
+
+def read_rows(value, width, count):
+    """Return rows given as nested lists, a flat list or a packed array as one flat sequence"""
+    if isinstance(value, dict) and "__ndarray__" in value:
+        value = unpack_array(value["__ndarray__"])
+    elif value and isinstance(value[0], (list, tuple)):
+        value = [item for row in value for item in row]
+    if len(value) != width * count:
+        raise ValueError(f"Expected {count} rows of {width} values, got {len(value)} values")
+    return value
+
+class FrameDecoder:
+    """Incremental decoder for the messages sent by one client.
+
+    The first bytes of a connection select the mode: framed clients start
+    with PROTOCOL_MAGIC, anything else is treated as legacy bare JSON.
+    Framed payloads are parsed exactly once, when they are complete.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.legacy = None
+        self.parts = []
+        self.flags = 0
+        self.capabilities = set()
+        self.compression = None
+        self.shared_buffers = None
+
+    def feed(self, data):
+        """Add received bytes and return the list of complete messages"""
+        self.buffer += data
+        if self.legacy is None:
+            if len(self.buffer) < len(PROTOCOL_MAGIC) and PROTOCOL_MAGIC.startswith(bytes(self.buffer)):
+                return []
+            self.legacy = not self.buffer.startswith(PROTOCOL_MAGIC)
+        if self.legacy:
+            return self._feed_legacy()
+        return self._feed_framed()
+
+    def _feed_framed(self):
+        messages = []
+        offset = 0
+        while len(self.buffer) - offset >= FRAME_HEADER.size:
+            magic, version, flags, length = FRAME_HEADER.unpack_from(self.buffer, offset)
+            if magic != PROTOCOL_MAGIC:
+                raise ProtocolError("Bad frame magic")
+            if version > PROTOCOL_VERSION:
+                raise ProtocolError(f"Unsupported protocol version {version}")
+            if length > MAX_FRAME_SIZE:
+                raise ProtocolError(f"Frame too large: {length} bytes")
+            end = offset + FRAME_HEADER.size + length
+            if len(self.buffer) < end:
+                break
+            self.parts.append(decompress_frame(bytes(self.buffer[offset + FRAME_HEADER.size:end]), flags))
+            self.flags |= flags
+            offset = end
+            if flags & FLAG_MORE:
+                continue
+            payload = b''.join(self.parts)
+            self.parts = []
+            messages.append(decode_payload(payload, self.flags))
+            self.flags = 0
+        if offset:
+            del self.buffer[:offset]
+        return messages
+
+    def _feed_legacy(self):
+        # A complete JSON object always ends with '}', so only attempt a
+        # parse when that is the case instead of on every chunk.
+        if not self.buffer.rstrip().endswith(b'}'):
+            return []
+        try:
+            text = self.buffer.decode('utf-8')
+        except UnicodeDecodeError:
+            return []
+        decoder = json.JSONDecoder()
+        messages = []
+        index = 0
+        while True:
+            while index < len(text) and text[index].isspace():
+                index += 1
+            if index >= len(text):
+                break
+            try:
+                message, index = decoder.raw_decode(text, index)
+            except json.JSONDecodeError:
+                break
+            messages.append(message)
+        if messages:
+            self.buffer = bytearray(text[index:].encode('utf-8'))
+        return messages
+
+    def iter_encode(self, message):
+        """Serialize a response in the mode the client talks.
+
+        Yields the data to send in pieces of at most STREAM_CHUNK_SIZE
+        payload bytes, so large responses are written out incrementally.
+        """
+        binary = not self.legacy and "binary" in self.capabilities
+        shared = self.shared_buffers if "shm" in self.capabilities else None
+        attachments = []
+        offset = 0
+        shared_parts = []
+        shared_offset = 0
+        shared_path = None
+
+        def pack(value):
+            nonlocal offset, shared_offset, shared_path
+            if not isinstance(value, PackedArray):
+                raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+            info = {"dtype": value.dtype, "shape": value.shape}
+            if shared is not None and len(value) >= SHM_THRESHOLD:
+                if shared_path is None:
+                    shared_path = shared.create()
+                info["shm"] = shared_path
+                info["offset"] = shared_offset
+                info["nbytes"] = len(value)
+                shared_parts.append(value.data)
+                shared_offset += len(value)
+            elif binary:
+                info["offset"] = offset
+                info["nbytes"] = len(value)
+                attachments.append(value.data)
+                offset += len(value)
+            else:
+                info["data"] = base64.b64encode(value.data).decode('ascii')
+            return {"__ndarray__": info}
+
+        text = json.dumps(message, default=pack).encode('utf-8')
+        if shared_parts:
+            with open(shared_path, "ab") as f:
+                for part in shared_parts:
+                    f.write(part)
+        flags = 0
+        if attachments:
+            text = b''.join([JSON_LENGTH.pack(len(text)), text] + attachments)
+            flags = FLAG_BINARY
+        payload = memoryview(text)
+        for start in range(0, max(len(payload), 1), STREAM_CHUNK_SIZE):
+            chunk = payload[start:start + STREAM_CHUNK_SIZE]
+            if self.legacy:
+                yield chunk
+            else:
+                more = start + STREAM_CHUNK_SIZE < len(payload)
+                chunk, compressed = compress_frame(chunk, self.compression)
+                yield encode_frame(chunk, flags | compressed | (FLAG_MORE if more else 0))
+
+def operation_failed(response):
+    """Return True if a command response reports a failure"""
+    if response.get("status") != "success":
+        return True
+    result = response.get("result")
+    if isinstance(result, dict):
+        return "error" in (result.get("command_result"), result.get("script_result"),
+                           result.get("function_result"), result.get("batch_result"))
+    return False
+
+def is_read_only(command):
+    """Return True if a command does not modify the document"""
+    return isinstance(command, dict) and command.get("type") in READ_ONLY_COMMANDS
+
+class ClientConnection:
+    """State of one connected client"""
+
+    def __init__(self, sock, address):
+        self.socket = sock
+        self.address = address
+        self.decoder = FrameDecoder()
+        self.commands = collections.deque()
+        self.outgoing = collections.deque()
+        self.write_buffer = memoryview(b'')
+        self.notifier = None
+        self.write_notifier = None
+        self.close_when_flushed = False
+        self.closed = False
+
+    @property
+    def is_local(self):
+        """True if the client runs on this host"""
+        return not isinstance(self.address, tuple) or self.address[0] in ("127.0.0.1", "::1", "::ffff:127.0.0.1")
+
+    def queue(self, message, on_sent=None):
+        """Queue a response to be streamed to the client
+
+        See timed_output for on_sent.
+        """
+        output = self.decoder.iter_encode(message)
+        if on_sent is not None:
+            output = timed_output(output, time.perf_counter(), on_sent)
+        self.outgoing.append(output)
+
+    def next_output(self):
+        """Pull up to STREAM_CHUNK_SIZE bytes of queued output"""
+        parts = []
+        size = 0
+        while self.outgoing and size < STREAM_CHUNK_SIZE:
+            part = next(self.outgoing[0], None)
+            if part is None:
+                self.outgoing.popleft()
+                continue
+            parts.append(part)
+            size += len(part)
+        return memoryview(b''.join(parts))
+
+class DocumentChangeTracker:
+    """Document observer that records which objects changed and when.
+
+    Every change bumps a per-document revision. A revision token handed
+    out with a context can later be passed back to get only the objects
+    added, modified or removed since then. The token embeds an epoch that
+    is unique to this tracker, so tokens from before a FreeCAD restart are
+    never mistaken for current ones, and a generation that is unique to
+    each opened document, so tokens of a closed document are not accepted
+    by a new document of the same name.
+    """
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.generations = itertools.count(1)
+        self.documents = {}
+
+    def _state(self, doc):
+        state = self.documents.get(doc.Name)
+        if state is None:
+            state = self.documents[doc.Name] = {
+                "generation": next(self.generations),
+                "revision": 0,
+                "floor": 0,
+                "created": {},
+                "changed": {},
+                "removed": {}
+            }
+        return state
+
+    def _bump(self, doc):
+        state = self._state(doc)
+        state["revision"] += 1
+        return state, state["revision"]
+
+    def slotCreatedObject(self, obj):
+        state, revision = self._bump(obj.Document)
+        state["created"][obj.Name] = revision
+        state["changed"][obj.Name] = revision
+        state["removed"].pop(obj.Name, None)
+
+    def slotChangedObject(self, obj, prop):
+        state, revision = self._bump(obj.Document)
+        state["changed"][obj.Name] = revision
+
+    def slotDeletedObject(self, obj):
+        state, revision = self._bump(obj.Document)
+        state["created"].pop(obj.Name, None)
+        state["changed"].pop(obj.Name, None)
+        removed = state["removed"]
+        removed[obj.Name] = revision
+        if len(removed) > MAX_TOMBSTONES:
+            # Forget the oldest half; tokens older than that get a full snapshot.
+            oldest = sorted(removed.items(), key=lambda item: item[1])[:len(removed) // 2]
+            for name, _ in oldest:
+                del removed[name]
+            state["floor"] = oldest[-1][1]
+
+    def slotCreatedDocument(self, doc):
+        self.documents.pop(doc.Name, None)
+
+    def slotDeletedDocument(self, doc):
+        self.documents.pop(doc.Name, None)
+
+    def object_revision(self, obj):
+        """Return the revision at which obj last changed, 0 if not since the tracker started"""
+        state = self.documents.get(obj.Document.Name)
+        return state["changed"].get(obj.Name, 0) if state else 0
+
+    def token(self, doc):
+        """Return the revision token describing the current state of a document"""
+        state = self._state(doc)
+        return f"{self.epoch}:{doc.Name}:{state['generation']}:{state['revision']}"
+
+    def changes_since(self, doc, token):
+        """Return (added, modified, removed) object names since a token.
+
+        Returns None when the token cannot be served as a delta, e.g. it was
+        issued by another server run, for another document or an earlier
+        document of the same name, or is too old.
+        """
+        try:
+            epoch, doc_name, generation, revision = token.rsplit(":", 3)
+            generation, revision = int(generation), int(revision)
+        except (AttributeError, ValueError):
+            return None
+        state = self.documents.get(doc.Name)
+        if state is None or epoch != self.epoch or doc_name != doc.Name or generation != state["generation"]:
+            return None
+        if revision < state["floor"] or revision > state["revision"]:
+            return None
+        added = []
+        modified = []
+        for name, changed in state["changed"].items():
+            if changed > revision:
+                if state["created"].get(name, 0) > revision:
+                    added.append(name)
+                else:
+                    modified.append(name)
+        removed = [name for name, deleted in state["removed"].items() if deleted > revision]
+        return added, modified, removed
+
+def compute_shape_properties(shape):
+    """Compute the derived geometry properties reported for a shape"""
+    properties = {"type": shape.ShapeType}
+    for key, attr in (("volume", "Volume"), ("area", "Area")):
+        try:
+            properties[key] = float(getattr(shape, attr))
+        except Exception:
+            properties[key] = None
+    try:
+        box = shape.BoundBox
+        properties["bound_box"] = [float(box.XMin), float(box.YMin), float(box.ZMin),
+                                   float(box.XMax), float(box.YMax), float(box.ZMax)]
+    except Exception:
+        properties["bound_box"] = None
+    try:
+        center = shape.CenterOfMass
+        properties["center_of_mass"] = [float(center.x), float(center.y), float(center.z)]
+    except Exception:
+        properties["center_of_mass"] = None
+    return properties
+
+class ShapePropertyCache:
+    """LRU cache of derived shape properties per document object.
+
+    Volume, area, bounding box and center of mass are expensive to compute
+    on large shapes. The cache is a document observer: an entry is dropped
+    when its object is recomputed, its Shape or Placement changes or it is
+    deleted. A Placement change moves the shape without a recompute.
+    """
+
+    def __init__(self, max_size=SHAPE_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, obj):
+        """Return the cached properties of obj.Shape, computing them on a miss"""
+        key = (obj.Document.Name, obj.Name)
+        properties = self.entries.get(key)
+        if properties is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return properties
+        self.misses += 1
+        properties = compute_shape_properties(obj.Shape)
+        self.entries[key] = properties
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return properties
+
+    def invalidate(self, obj):
+        self.entries.pop((obj.Document.Name, obj.Name), None)
+
+    def stats(self):
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+    def slotChangedObject(self, obj, prop):
+        if prop in ("Shape", "Placement"):
+            self.invalidate(obj)
+
+    def slotRecomputedObject(self, obj):
+        self.invalidate(obj)
+
+    def slotDeletedObject(self, obj):
+        self.invalidate(obj)
+
+    def slotDeletedDocument(self, doc):
+        for key in [key for key in self.entries if key[0] == doc.Name]:
+            del self.entries[key]
+
+def tessellate_shape(shape, linear_deflection, angular_deflection=None):
+    """Mesh a shape and return its vertices and triangle indices as PackedArrays
+
+    With an angular deflection (radians) the shape is meshed by MeshPart,
+    otherwise by Shape.tessellate(), which only honours the linear one.
+    """
+    if angular_deflection is None:
+        points, triangles = shape.tessellate(linear_deflection)
+    else:
+        import MeshPart
+        mesh = MeshPart.meshFromShape(Shape=shape, LinearDeflection=linear_deflection,
+                                      AngularDeflection=angular_deflection, Relative=False)
+        points, triangles = mesh.Topology
+    vertices = PackedArray([c for p in points for c in (p.x, p.y, p.z)], "<f4", [len(points), 3])
+    indices = PackedArray([i for t in triangles for i in t], "<u4", [len(triangles), 3])
+    return vertices, indices
+
+class TessellationCache:
+    """LRU cache of shape meshes.
+
+    Entries are keyed by object, object revision (see DocumentChangeTracker)
+    and deflections, so a changed object simply misses and its stale meshes
+    age out. Revisions restart when a document is closed, so the cache is a
+    document observer that drops the meshes of closed documents. The cache
+    is bounded by the bytes of mesh data it holds.
+    """
+
+    def __init__(self, max_bytes=TESSELLATION_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        mesh = self.entries.get(key)
+        if mesh is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return mesh
+
+    def put(self, key, mesh):
+        size = sum(len(part) for part in mesh)
+        if size > self.max_bytes:
+            return
+        self.entries[key] = mesh
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, old = self.entries.popitem(last=False)
+            self.bytes -= sum(len(part) for part in old)
+            self.evictions += 1
+
+    def slotDeletedDocument(self, doc):
+        for key in [key for key in self.entries if key[0] == doc.Name]:
+            self.bytes -= sum(len(part) for part in self.entries.pop(key))
+
+    def stats(self):
+        return {
+            "size": len(self.entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+class CodeCache:
+    """LRU cache of compiled code objects keyed by the hash of their source.
+
+    Agents often send the same helper script or command template again and
+    again; compiling it once saves the parse and compile cost of every
+    repetition.
+    """
+
+    def __init__(self, max_size=CODE_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def compile(self, source, filename="<mcp-script>"):
+        """Return the code object for source, compiling it on a miss"""
+        key = hashlib.sha256(f"{filename}\0{source}".encode('utf-8')).digest()
+        code = self.entries.get(key)
+        if code is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return code
+        self.misses += 1
+        code = compile(source, filename, "exec")
+        self.entries[key] = code
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return code
+
+    def stats(self):
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+def approximate_size(value, limit=100000):
+    """Estimate the memory held by value and the containers it references"""
+    total = 0
+    seen = set()
+    pending = [value]
+    while pending and len(seen) < limit:
+        item = pending.pop()
+        if id(item) in seen or isinstance(item, (type, type(sys))) or callable(item):
+            continue
+        seen.add(id(item))
+        try:
+            total += sys.getsizeof(item)
+        except TypeError:
+            continue
+        if isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            pending.extend(item)
+    return total
+
+class ScriptSession:
+    """Namespace kept alive across the scripts run in one named session"""
+
+    def __init__(self, name, idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.name = name
+        self.idle_timeout = idle_timeout
+        self.namespace = {}
+        self.created = time.time()
+        self.last_used = self.created
+        self.calls = 0
+
+    def is_idle(self, now):
+        return now - self.last_used > self.idle_timeout
+
+    def info(self, now):
+        user_names = [key for key in self.namespace if key not in ("App", "Gui", "doc", "__builtins__")]
+        return {
+            "name": self.name,
+            "variables": sorted(user_names),
+            "approximate_bytes": approximate_size({key: self.namespace[key] for key in user_names}),
+            "calls": self.calls,
+            "idle_seconds": round(now - self.last_used, 3),
+            "idle_timeout": self.idle_timeout
+        }
+
+class SessionManager:
+    """Named script sessions with idle eviction.
+
+    Idle sessions are dropped lazily whenever sessions are used, so there is
+    no timer running while the server is idle. When more than MAX_SESSIONS
+    exist, the least recently used one is dropped.
+    """
+
+    def __init__(self, max_sessions=MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self.sessions = collections.OrderedDict()
+        self.evicted = 0
+
+    def evict_idle(self):
+        now = time.time()
+        for name in [name for name, session in self.sessions.items() if session.is_idle(now)]:
+            del self.sessions[name]
+            self.evicted += 1
+            App.Console.PrintMessage(f"Dropped idle MCP session {name}\n")
+
+    def create(self, name=None, idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.evict_idle()
+        name = name or uuid.uuid4().hex[:12]
+        if name in self.sessions:
+            raise ValueError(f"Session already exists: {name}")
+        session = self.sessions[name] = ScriptSession(name, idle_timeout)
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+            self.evicted += 1
+        return session
+
+    def get(self, name):
+        """Return the named session, creating it if it does not exist"""
+        self.evict_idle()
+        session = self.sessions.get(name)
+        if session is None:
+            session = self.create(name)
+        self.sessions.move_to_end(name)
+        session.last_used = time.time()
+        session.calls += 1
+        return session
+
+    def close(self, name):
+        return self.sessions.pop(name, None) is not None
+
+    def info(self):
+        self.evict_idle()
+        now = time.time()
+        return [session.info(now) for session in self.sessions.values()]
+
+def json_safe(value):
+    """Return value if it can be sent as JSON, otherwise its repr"""
+    try:
+        json.dumps(value)
+        return value
+    except (TypeError, ValueError):
+        return repr(value)
+
+class JobHandle:
+    """Passed to job scripts as `job` to report progress and check for cancellation"""
+
+    def __init__(self, job):
+        self._job = job
+
+    @property
+    def cancelled(self):
+        return self._job.cancel_requested
+
+    def progress(self, fraction, message=None):
+        self._job.progress = max(0.0, min(1.0, float(fraction)))
+        if message is not None:
+            self._job.message = str(message)
+
+class Job:
+    """A script submitted to run in the background, in steps"""
+
+    def __init__(self, job_id, script, session=None):
+        self.id = job_id
+        self.script = script
+        self.session = session
+        self.status = "queued"
+        self.progress = 0.0
+        self.message = None
+        self.result = None
+        self.error = None
+        self.traceback = None
+        self.cancel_requested = False
+        self.steps = 0
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.generator = None
+        self.future = None
+
+    @property
+    def done(self):
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    def info(self):
+        info = {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": self.progress,
+            "message": self.message,
+            "cancel_requested": self.cancel_requested,
+            "steps": self.steps,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished
+        }
+        if self.status == "succeeded":
+            info["result"] = self.result
+        elif self.status == "failed":
+            info["error"] = self.error
+            info["traceback"] = self.traceback
+        return info
+
+class JobManager:
+    """Runs background jobs on the GUI thread in small steps.
+
+    A job script may define main(job). If main is a generator function,
+    every yield is a step boundary: the job yields to the Qt event loop
+    after JOB_TIME_SLICE, and cancellation takes effect at the next
+    boundary. Values yielded as numbers are taken as progress fractions.
+    Scripts without main, or with a plain main, run in a single step.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.jobs = collections.OrderedDict()
+        self.active = collections.deque()
+        self.step_scheduled = False
+
+    def submit(self, script, session=None):
+        job = Job(uuid.uuid4().hex[:12], script, session)
+        # Compile now so syntax errors are reported to the submitter.
+        self.server.code_cache.compile(script)
+        self.jobs[job.id] = job
+        self.active.append(job)
+        self._prune()
+        self._schedule()
+        return job
+
+    def track(self):
+        """Create a running job for work done outside the GUI thread
+
+        The caller sets job.future and calls complete() once it is done.
+        """
+        job = Job(uuid.uuid4().hex[:12], None)
+        job.status = "running"
+        job.started = time.time()
+        self.jobs[job.id] = job
+        self._prune()
+        return job
+
+    def complete(self, job, result=None, error=None, traceback=None):
+        """Finish a job created by track()"""
+        if job.done:
+            return
+        if error is None:
+            job.result = json_safe(result)
+            self._finish(job, "succeeded")
+        else:
+            job.error = error
+            job.traceback = traceback
+            self._finish(job, "failed")
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise ValueError(f"Unknown job: {job_id}")
+        return job
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if not job.done:
+            job.cancel_requested = True
+            if job.future is not None:
+                # Kills the worker if the request already runs there
+                self.server.compute_pool.cancel(job.future)
+                self._finish(job, "cancelled")
+            elif job.status == "queued":
+                self._finish(job, "cancelled")
+            self._schedule()
+        return job
+
+    def cancel_tracked(self):
+        """Cancel the jobs created by track() that have not finished yet"""
+        for job in list(self.jobs.values()):
+            if job.future is not None and not job.done:
+                job.cancel_requested = True
+                self.server.compute_pool.cancel(job.future)
+                self._finish(job, "cancelled")
+
+    def _schedule(self):
+        if self.active and not self.step_scheduled:
+            self.step_scheduled = True
+            QtCore.QTimer.singleShot(0, self._run_slice)
+
+    def _run_slice(self):
+        self.step_scheduled = False
+        deadline = time.perf_counter() + JOB_TIME_SLICE
+        while self.active and time.perf_counter() < deadline:
+            job = self.active[0]
+            if job.done:
+                self.active.popleft()
+                continue
+            self._step(job)
+            # Rotate so concurrent jobs share the time slices.
+            if self.active and self.active[0] is job:
+                self.active.rotate(-1)
+        self._schedule()
+
+    def _step(self, job):
+        recompute = self.server.recompute
+        try:
+            if job.cancel_requested:
+                if job.generator is not None:
+                    job.generator.close()
+                self._finish(job, "cancelled")
+                return
+            job.steps += 1
+            with recompute.deferred():
+                if job.status == "queued":
+                    job.status = "running"
+                    job.started = time.time()
+                    namespace = self.server._script_namespace(job.session)
+                    namespace["job"] = JobHandle(job)
+                    exec(self.server.code_cache.compile(job.script), namespace)
+                    main = namespace.get("main")
+                    value = main(namespace["job"]) if callable(main) else None
+                    if inspect.isgenerator(value):
+                        job.generator = value
+                    else:
+                        job.result = json_safe(value)
+                        self._finish(job, "succeeded")
+                        return
+                try:
+                    value = next(job.generator)
+                    if isinstance(value, (int, float)):
+                        JobHandle(job).progress(value)
+                except StopIteration as stop:
+                    job.result = json_safe(stop.value)
+                    self._finish(job, "succeeded")
+        except Exception as e:
+            job.error = str(e)
+            job.traceback = traceback.format_exc()
+            self._finish(job, "failed")
+        finally:
+            if not recompute.depth:
+                recompute.flush()
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished = time.time()
+        job.generator = None
+        job.future = None
+        if status == "succeeded":
+            job.progress = 1.0
+        if job in self.active:
+            self.active.remove(job)
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+def find_worker_executable():
+    """Return the FreeCADCmd executable used for compute workers"""
+    override = os.environ.get("FREECAD_MCP_WORKER")
+    if override:
+        return override
+    names = ["FreeCADCmd.exe"] if sys.platform == "win32" else ["FreeCADCmd", "freecadcmd"]
+    for name in names:
+        path = os.path.join(App.getHomePath(), "bin", name)
+        if os.path.exists(path):
+            return path
+    for name in names:
+        path = shutil.which(name)
+        if path:
+            return path
+    raise RuntimeError("FreeCADCmd not found, set FREECAD_MCP_WORKER to its path")
+
+class ComputePool:
+    """Headless FreeCADCmd processes for geometry work that needs no document.
+
+    Each request is run by a thread of a ThreadPoolExecutor that talks to
+    one worker process over its stdin and stdout, so the GUI thread only
+    serializes shapes and merges results. Completions are handed back to
+    the GUI thread through a socket pair watched by a QSocketNotifier.
+    Processes are started on first use and reused; cancelling a running
+    request kills its process, so a hung script does not hold a thread.
+    """
+
+    def __init__(self, size=COMPUTE_WORKERS):
+        self.size = size
+        self.executor = None
+        self.idle = queue.LifoQueue()
+        self.processes = set()
+        self.lock = threading.Lock()
+        self.completed = collections.deque()
+        self.tasks = {}
+        self.wake_reader = None
+        self.wake_writer = None
+        self.notifier = None
+        self.submitted = 0
+        self.failed = 0
+
+    def submit(self, request, callback):
+        """Run request in a worker; callback(reply) is called on the GUI thread"""
+        if self.executor is None:
+            self._start()
+        self.submitted += 1
+        task = {"process": None, "cancelled": False}
+        future = self.executor.submit(self._run, request, task)
+        with self.lock:
+            self.tasks[future] = task
+        future.add_done_callback(lambda done: self._completed(done, callback))
+        return future
+
+    def cancel(self, future):
+        """Cancel a request, killing the worker process if it already runs"""
+        if future.cancel():
+            return
+        with self.lock:
+            task = self.tasks.get(future)
+            if task is None:
+                return
+            task["cancelled"] = True
+            process = task["process"]
+            if process is not None:
+                # Killed under the lock, so it cannot be handed to another
+                # request in the meantime
+                self.processes.discard(process)
+                try:
+                    process.kill()
+                except OSError:
+                    pass
+
+    def _start(self):
+        self.wake_reader, self.wake_writer = socket.socketpair()
+        self.wake_reader.setblocking(False)
+        self.wake_writer.setblocking(False)
+        self.notifier = QtCore.QSocketNotifier(self.wake_reader.fileno(), QtCore.QSocketNotifier.Read)
+        self.notifier.activated.connect(self._deliver)
+        self.executor = ThreadPoolExecutor(self.size, thread_name_prefix="mcp-compute")
+
+    def _completed(self, future, callback):
+        # Runs on the executor thread, or on the GUI thread for cancellations.
+        with self.lock:
+            self.tasks.pop(future, None)
+        writer = self.wake_writer
+        if writer is None:
+            # Finished after shutdown, when there is no one to deliver to.
+            return
+        self.completed.append((future, callback))
+        try:
+            writer.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass
+
+    def _deliver(self, *args):
+        try:
+            while self.wake_reader.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+        while self.completed:
+            future, callback = self.completed.popleft()
+            if future.cancelled():
+                continue
+            try:
+                reply = future.result()
+            except Exception as e:
+                self.failed += 1
+                reply = {"error": str(e), "traceback": traceback.format_exc()}
+            try:
+                callback(reply)
+            except Exception as e:
+                App.Console.PrintError(f"Error merging compute result: {str(e)}\n")
+
+    def _spawn(self):
+        process = subprocess.Popen(
+            [find_worker_executable(), WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            encoding="utf-8",
+            creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0)
+        )
+        with self.lock:
+            self.processes.add(process)
+        return process
+
+    def _run(self, request, task):
+        # Runs on an executor thread.
+        try:
+            process = self.idle.get_nowait()
+        except queue.Empty:
+            process = self._spawn()
+        with self.lock:
+            cancelled = task["cancelled"]
+            task["process"] = process
+        if cancelled:
+            self._discard(process)
+            raise RuntimeError("Compute request cancelled")
+        try:
+            process.stdin.write(json.dumps(request) + "\n")
+            process.stdin.flush()
+            while True:
+                line = process.stdout.readline()
+                if not line:
+                    raise RuntimeError("Compute worker exited")
+                if line.startswith(WORKER_MARKER):
+                    reply = json.loads(line[len(WORKER_MARKER):])
+                    break
+        except Exception:
+            self._discard(process)
+            raise
+        with self.lock:
+            task["process"] = None
+            if not task["cancelled"]:
+                self.idle.put(process)
+        return reply
+
+    def _discard(self, process):
+        with self.lock:
+            self.processes.discard(process)
+        try:
+            process.kill()
+        except OSError:
+            pass
+
+    def shutdown(self):
+        if self.executor is not None:
+            # Cancelled by hand: shutdown(cancel_futures=True) needs Python
+            # 3.9, and some FreeCAD builds still bundle 3.8.
+            with self.lock:
+                futures = list(self.tasks)
+            for future in futures:
+                self.cancel(future)
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        with self.lock:
+            processes = list(self.processes)
+        for process in processes:
+            self._discard(process)
+        self.idle = queue.LifoQueue()
+        if self.notifier is not None:
+            self.notifier.setEnabled(False)
+            self.notifier.deleteLater()
+            self.notifier = None
+        for sock in (self.wake_reader, self.wake_writer):
+            if sock is not None:
+                sock.close()
+        self.wake_reader = self.wake_writer = None
+        self.completed.clear()
+
+    def stats(self):
+        return {
+            "workers": self.size,
+            "processes": len(self.processes),
+            "submitted": self.submitted,
+            "failed": self.failed
+        }
+
+def resident_memory():
+    """Return the resident set size of this process in bytes, or None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+class Histogram:
+    """Latency histogram over LATENCY_BUCKETS"""
+
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket holding it"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max
+        }
+
+def escape_label(value):
+    """Escape a Prometheus label value"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class ServerMetrics:
+    """Request counters and per-command phase timings.
+
+    Phases are: queue (received until dispatched), decode (frame and JSON
+    decoding), exec (handler, without context collection), context
+    (document context collection), encode (JSON encoding, framing and
+    compression) and send (waiting for the socket until the last frame is
+    handed over). Commands are labelled by type when it is one of
+    commands, the known command types, and as "unknown" otherwise, so
+    clients cannot add labels of their own.
+    """
+
+    def __init__(self, commands):
+        self.commands = frozenset(commands)
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self.histograms = {}
+        self.requests = collections.Counter()
+        self.errors = collections.Counter()
+        self.failures = collections.Counter()
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.connections = 0
+        self.context_time = 0.0
+
+    def label(self, command):
+        name = command.get("type") if isinstance(command, dict) else None
+        return name if name in self.commands else "unknown"
+
+    def observe(self, command, phase, seconds):
+        histogram = self.histograms.get((command, phase))
+        if histogram is None:
+            histogram = self.histograms[(command, phase)] = Histogram()
+        histogram.observe(seconds)
+
+    def record(self, command, response):
+        self.requests[command] += 1
+        if response.get("status") != "success":
+            self.errors[command] += 1
+        elif operation_failed(response):
+            self.failures[command] += 1
+
+    def snapshot(self, clients=0):
+        phases = {}
+        for (command, phase), histogram in sorted(self.histograms.items()):
+            phases.setdefault(command, {})[phase] = histogram.summary()
+        return {
+            "uptime": time.time() - self.started,
+            "requests": dict(self.requests),
+            "errors": dict(self.errors),
+            "failures": dict(self.failures),
+            "bytes_received": self.bytes_received,
+            "bytes_sent": self.bytes_sent,
+            "connections": self.connections,
+            "clients": clients,
+            "resident_memory": resident_memory(),
+            "phases": phases
+        }
+
+    def prometheus(self, clients=0):
+        """Render the metrics in the Prometheus text exposition format"""
+        lines = [
+            "# TYPE freecad_mcp_phase_seconds histogram"
+        ]
+        for (command, phase), histogram in sorted(self.histograms.items()):
+            labels = f'command="{escape_label(command)}",phase="{escape_label(phase)}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'freecad_mcp_phase_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"freecad_mcp_phase_seconds_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"freecad_mcp_phase_seconds_count{{{labels}}} {histogram.count}")
+        for name, counter in (("requests", self.requests), ("errors", self.errors), ("failures", self.failures)):
+            lines.append(f"# TYPE freecad_mcp_{name}_total counter")
+            for command, count in sorted(counter.items()):
+                lines.append(f'freecad_mcp_{name}_total{{command="{escape_label(command)}"}} {count}')
+        for name, kind, value in (
+            ("bytes_received_total", "counter", self.bytes_received),
+            ("bytes_sent_total", "counter", self.bytes_sent),
+            ("connections_total", "counter", self.connections),
+            ("clients", "gauge", clients),
+            ("uptime_seconds", "gauge", time.time() - self.started),
+            ("resident_memory_bytes", "gauge", resident_memory())
+        ):
+            if value is not None:
+                lines.append(f"# TYPE freecad_mcp_{name} {kind}")
+                lines.append(f"freecad_mcp_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+class MetricsEndpoint:
+    """Minimal HTTP endpoint serving ServerMetrics to Prometheus.
+
+    Runs on the Qt event loop like the command socket. Every request,
+    whatever its path, gets the metrics text and the connection is closed.
+    """
+
+    def __init__(self, server, host, port):
+        self.server = server
+        self.host = host
+        self.port = port
+        self.socket = None
+        self.notifier = None
+        self.requests = {}
+
+    def start(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.host, self.port))
+        self.socket.listen(LISTEN_BACKLOG)
+        self.socket.setblocking(False)
+        self.notifier = QtCore.QSocketNotifier(self.socket.fileno(), QtCore.QSocketNotifier.Read)
+        self.notifier.activated.connect(self._accept)
+
+    def stop(self):
+        for sock, (notifier, _) in list(self.requests.items()):
+            self._close(sock)
+        if self.notifier is not None:
+            self.notifier.setEnabled(False)
+            self.notifier.deleteLater()
+            self.notifier = None
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def _accept(self, *args):
+        while self.socket is not None:
+            try:
+                sock, _ = self.socket.accept()
+            except (BlockingIOError, OSError):
+                return
+            sock.setblocking(False)
+            notifier = QtCore.QSocketNotifier(sock.fileno(), QtCore.QSocketNotifier.Read)
+            notifier.activated.connect(lambda *args, sock=sock: self._read(sock))
+            self.requests[sock] = (notifier, bytearray())
+
+    def _read(self, sock):
+        notifier, buffer = self.requests[sock]
+        try:
+            data = sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        buffer += data
+        if data and b"\r\n\r\n" not in buffer and len(buffer) < 65536:
+            return
+        if data:
+            body = self.server.metrics.prometheus(len(self.server.clients)).encode("utf-8")
+            response = (b"HTTP/1.0 200 OK\r\n"
+                        b"Content-Type: text/plain; version=0.0.4\r\n"
+                        b"Content-Length: " + str(len(body)).encode("ascii") + b"\r\n\r\n" + body)
+            try:
+                # The response is small; a short blocking write is fine.
+                sock.settimeout(1.0)
+                sock.sendall(response)
+            except OSError:
+                pass
+        self._close(sock)
+
+    def _close(self, sock):
+        notifier, _ = self.requests.pop(sock)
+        notifier.setEnabled(False)
+        notifier.deleteLater()
+        sock.close()
+
+def timed_output(output, queued, on_sent):
+    """Wrap a response generator to time its encoding and sending.
+
+    on_sent(encode_seconds, send_seconds) is called once the last frame
+    has been pulled for writing.
+    """
+    encode = 0.0
+    while True:
+        started = time.perf_counter()
+        part = next(output, None)
+        encode += time.perf_counter() - started
+        if part is None:
+            break
+        yield part
+    on_sent(encode, time.perf_counter() - queued - encode)
+
+class ScriptProfiler:
+    """Optional cProfile run around script execution.
+
+    option is the profile parameter of run_script and send_command: a
+    false value disables profiling, true profiles with the defaults and a
+    dict may set "top" (number of hot functions listed), "sort"
+    ("tottime" or "cumulative") and "stats" (also return the raw pstats
+    data, marshalled and base64-encoded as written by dump_stats).
+    """
+
+    def __init__(self, option=False):
+        options = option if isinstance(option, dict) else {}
+        self.enabled = bool(option)
+        self.top = int(options.get("top", PROFILE_TOP_FUNCTIONS))
+        self.sort = options.get("sort", "tottime")
+        if self.sort not in ("tottime", "cumulative"):
+            raise ValueError(f"Unknown profile sort order: {self.sort}")
+        self.include_stats = bool(options.get("stats", False))
+        self.profiler = cProfile.Profile() if self.enabled else None
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        if self.enabled:
+            self.started = time.perf_counter()
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        if self.enabled:
+            self.profiler.disable()
+            self.elapsed = time.perf_counter() - self.started
+        return False
+
+    def report(self):
+        """Summarize the profile: hot functions and native versus Python time"""
+        stats = pstats.Stats(self.profiler).stats
+        # Leave out the profiler's own disable call
+        stats = {key: value for key, value in stats.items() if "_lsprof.Profiler" not in key[2]}
+        native = 0.0
+        total = 0.0
+        functions = []
+        for (filename, line, name), (_, calls, tottime, cumtime, _) in stats.items():
+            total += tottime
+            if filename == "~" and PROFILE_NATIVE_PATTERN.match(name):
+                native += tottime
+            functions.append({
+                "function": name,
+                "file": None if filename == "~" else filename,
+                "line": line,
+                "calls": calls,
+                "self_time": tottime,
+                "cumulative_time": cumtime
+            })
+        key = "self_time" if self.sort == "tottime" else "cumulative_time"
+        functions.sort(key=lambda function: function[key], reverse=True)
+        report = {
+            "elapsed": self.elapsed,
+            "total_time": total,
+            "native_time": native,
+            "python_time": total - native,
+            "functions": functions[:self.top]
+        }
+        if self.include_stats:
+            report["stats"] = base64.b64encode(marshal.dumps(stats)).decode("ascii")
+        return report
+
+class RecomputeScheduler:
+    """Coalesces the recompute requests made while commands run.
+
+    Scripts that opt in, and every script run inside a batch, get document
+    proxies whose recompute() only marks the document as pending. flush()
+    then recomputes each pending document once, restricted to its touched
+    objects and the objects depending on them. Other scripts get the real
+    documents and recompute immediately.
+    """
+
+    def __init__(self):
+        self.pending = {}
+        self.depth = 0
+        self.coalescing = False
+        self.requested = 0
+        self.flushed = 0
+
+    def wrap(self, doc):
+        """Return a proxy of doc whose recompute() calls are deferred"""
+        if doc is None or isinstance(doc, DeferredDocument):
+            return doc
+        return DeferredDocument(doc, self)
+
+    def request(self, doc):
+        self.pending[doc.Name] = doc
+        self.requested += 1
+
+    def discard(self, doc):
+        self.pending.pop(doc.Name, None)
+
+    def is_pending(self, doc):
+        return doc.Name in self.pending
+
+    @contextlib.contextmanager
+    def deferred(self, coalesce=False):
+        """Keep nested commands from flushing; the outermost one does
+
+        With coalesce, nested commands coalesce their recomputes by default.
+        """
+        coalescing = self.coalescing
+        self.depth += 1
+        self.coalescing = coalescing or coalesce
+        try:
+            yield
+        finally:
+            self.depth -= 1
+            self.coalescing = coalescing
+
+    def flush(self):
+        """Recompute the dirty objects of every pending document.
+
+        Returns the number of objects recomputed per document.
+        """
+        recomputed = {}
+        pending, self.pending = self.pending, {}
+        for name, doc in pending.items():
+            if name not in App.listDocuments():
+                continue
+            objects = dirty_objects(doc)
+            if objects:
+                doc.recompute(objects)
+                self.flushed += 1
+            recomputed[name] = len(objects)
+        return recomputed
+
+    def stats(self):
+        return {
+            "pending": sorted(self.pending),
+            "requested": self.requested,
+            "flushed": self.flushed
+        }
+
+def dirty_objects(doc):
+    """Return the touched objects of doc and every object depending on them"""
+    dirty = {}
+    for obj in doc.Objects:
+        if "Touched" in obj.State and obj.Name not in dirty:
+            dirty[obj.Name] = obj
+            for dependent in obj.InListRecursive:
+                dirty.setdefault(dependent.Name, dependent)
+    return list(dirty.values())
+
+class DeferredDocument:
+    """Document proxy that hands recompute() calls to a RecomputeScheduler"""
+
+    def __init__(self, doc, scheduler):
+        object.__setattr__(self, "_doc", doc)
+        object.__setattr__(self, "_scheduler", scheduler)
+
+    def __getattr__(self, name):
+        return getattr(self._doc, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._doc, name, value)
+
+    def __eq__(self, other):
+        if isinstance(other, DeferredDocument):
+            other = other._doc
+        return self._doc == other
+
+    def __hash__(self):
+        return hash(self._doc)
+
+    def __repr__(self):
+        return repr(self._doc)
+
+    def recompute(self, *args, **kwargs):
+        self._scheduler.request(self._doc)
+        return 0
+
+class DeferredApp:
+    """Proxy of the FreeCAD module whose documents defer recompute() calls"""
+
+    def __init__(self, scheduler):
+        self._scheduler = scheduler
+
+    def __getattr__(self, name):
+        return getattr(App, name)
+
+    @property
+    def ActiveDocument(self):
+        return self._scheduler.wrap(App.ActiveDocument)
+
+    def activeDocument(self):
+        return self._scheduler.wrap(App.activeDocument())
+
+    def getDocument(self, name):
+        return self._scheduler.wrap(App.getDocument(name))
+
+    def newDocument(self, *args, **kwargs):
+        return self._scheduler.wrap(App.newDocument(*args, **kwargs))
+
 class FreeCADMCPServer:
-    def __init__(self, host='localhost', port=9876):
+    """Socket server that runs MCP commands inside FreeCAD.
+
+    The sockets are watched with QSocketNotifier, so the server only wakes
+    up when a connection or data is ready. The notifiers fire on the GUI
+    thread, which keeps every FreeCAD API call on that thread. Any number
+    of clients can be connected; their commands run one at a time through
+    a queue that serves the clients round-robin.
+    """
+
+    def __init__(self, host=SERVER_HOST, port=SERVER_PORT, socket_path=SERVER_SOCKET,
+                 metrics_port=METRICS_PORT):
         self.host = host
         self.port = port
+        self.socket_path = socket_path
+        self.metrics = ServerMetrics(
+            name[len("handle_"):] for name in dir(type(self)) if name.startswith("handle_"))
+        self.metrics_endpoint = MetricsEndpoint(self, host, metrics_port) if metrics_port else None
+        self.unix_socket_bound = False
         self.running = False
         self.socket = None
-        self.client = None
-        self.buffer = b''
-        self.timer = None
+        self.server_notifier = None
+        self.clients = []
+        self.ready_clients = collections.deque()
+        self.drain_scheduled = False
+        self.tracker = DocumentChangeTracker()
+        self.shape_cache = ShapePropertyCache()
+        self.mesh_cache = TessellationCache()
+        self.shared_buffers = SharedBufferPool()
+        self.recompute = RecomputeScheduler()
+        self.code_cache = CodeCache()
+        self.functions = {}
+        self.sessions = SessionManager()
+        self.jobs = JobManager(self)
+        self.compute_pool = ComputePool()
     
     def start(self):
         self.running = True
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        
         try:
-            self.socket.bind((self.host, self.port))
-            self.socket.listen(1)
-            self.socket.setblocking(False)
-            self.timer = QtCore.QTimer()
-            self.timer.timeout.connect(self._process_server)
-            self.timer.start(100)  # 100ms interval
-            App.Console.PrintMessage(f"FreeCAD MCP server started on {self.host}:{self.port}\n")
+            address = self._listen()
+            self.server_notifier = QtCore.QSocketNotifier(self.socket.fileno(), QtCore.QSocketNotifier.Read)
+            self.server_notifier.activated.connect(self._accept_clients)
+            App.addDocumentObserver(self.tracker)
+            App.addDocumentObserver(self.shape_cache)
+            App.addDocumentObserver(self.mesh_cache)
+            App.Console.PrintMessage(f"FreeCAD MCP server started on {address}\n")
         except Exception as e:
             App.Console.PrintError(f"Failed to start server: {str(e)}\n")
             self.stop()
+            return
+        if self.metrics_endpoint:
+            # Metrics are optional; the server keeps running without them.
+            try:
+                self.metrics_endpoint.start()
+                App.Console.PrintMessage(
+                    f"FreeCAD MCP metrics on http://{self.host}:{self.metrics_endpoint.port}/metrics\n")
+            except Exception as e:
+                App.Console.PrintError(f"Failed to start metrics endpoint: {str(e)}\n")
+                self.metrics_endpoint.stop()
+                self.metrics_endpoint = None
+
+    def _listen(self):
+        """Open the listening socket, preferring the Unix domain socket"""
+        if self.socket_path and hasattr(socket, "AF_UNIX"):
+            try:
+                self.socket = self._listen_unix()
+                return self.socket_path
+            except OSError as e:
+                App.Console.PrintError(
+                    f"Cannot listen on {self.socket_path}: {str(e)}, falling back to TCP\n")
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.host, self.port))
+        self.socket.listen(LISTEN_BACKLOG)
+        self.socket.setblocking(False)
+        return f"{self.host}:{self.port}"
+
+    def _listen_unix(self):
+        # A socket file left behind by a FreeCAD that crashed blocks bind(),
+        # but one another running FreeCAD listens on must be left alone.
+        try:
+            if stat.S_ISSOCK(os.stat(self.socket_path).st_mode):
+                probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                try:
+                    probe.connect(self.socket_path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    os.remove(self.socket_path)
+                else:
+                    raise OSError(errno.EADDRINUSE, "Socket is in use by another server")
+                finally:
+                    probe.close()
+        except FileNotFoundError:
+            pass
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.bind(self.socket_path)
+            os.chmod(self.socket_path, 0o600)
+            sock.listen(LISTEN_BACKLOG)
+            sock.setblocking(False)
+        except OSError:
+            sock.close()
+            raise
+        self.unix_socket_bound = True
+        return sock
             
     def stop(self):
+        if self.running:
+            App.removeDocumentObserver(self.tracker)
+            App.removeDocumentObserver(self.shape_cache)
+            App.removeDocumentObserver(self.mesh_cache)
         self.running = False
-        if self.timer:
-            self.timer.stop()
-            self.timer = None
+        for client in list(self.clients):
+            self._close_client(client)
+        self._release_notifier(self.server_notifier)
+        self.server_notifier = None
+        # Their results could no longer be delivered.
+        self.jobs.cancel_tracked()
+        self.compute_pool.shutdown()
+        self.shared_buffers.clear()
+        if self.metrics_endpoint:
+            self.metrics_endpoint.stop()
         if self.socket:
             self.socket.close()
-        if self.client:
-            self.client.close()
         self.socket = None
-        self.client = None
+        if self.unix_socket_bound:
+            try:
+                os.remove(self.socket_path)
+            except OSError:
+                pass
+            self.unix_socket_bound = False
         App.Console.PrintMessage("FreeCAD MCP server stopped\n")
 
-    def _process_server(self):
-        if not self.running:
+    def _release_notifier(self, notifier):
+        # Notifiers must be disabled before their socket is closed.
+        if notifier:
+            notifier.setEnabled(False)
+            notifier.deleteLater()
+
+    def _accept_clients(self, *args):
+        while self.running and self.socket:
+            try:
+                sock, address = self.socket.accept()
+            except BlockingIOError:
+                return
+            except Exception as e:
+                App.Console.PrintError(f"Error accepting connection: {str(e)}\n")
+                return
+            sock.setblocking(False)
+            client = ClientConnection(sock, address)
+            client.notifier = QtCore.QSocketNotifier(sock.fileno(), QtCore.QSocketNotifier.Read)
+            client.notifier.activated.connect(lambda *args, client=client: self._on_client_readable(client))
+            client.write_notifier = QtCore.QSocketNotifier(sock.fileno(), QtCore.QSocketNotifier.Write)
+            client.write_notifier.setEnabled(False)
+            client.write_notifier.activated.connect(lambda *args, client=client: self._write_pending(client))
+            self.clients.append(client)
+            self.metrics.connections += 1
+            App.Console.PrintMessage(f"Connected to client: {address}\n")
+
+    def _on_client_readable(self, client):
+        if client.closed:
             return
-            
         try:
-            if not self.client and self.socket:
-                try:
-                    self.client, address = self.socket.accept()
-                    self.client.setblocking(False)
-                    App.Console.PrintMessage(f"Connected to client: {address}\n")
-                except BlockingIOError:
-                    pass
-                except Exception as e:
-                    App.Console.PrintError(f"Error accepting connection: {str(e)}\n")
-                
-            if self.client:
-                try:
-                    try:
-                        data = self.client.recv(8192)
-                        if data:
-                            self.buffer += data
-                            try:
-                                command = json.loads(self.buffer.decode('utf-8'))
-                                self.buffer = b''
-                                response = self.execute_command(command)
-                                response_json = json.dumps(response)
-                                self.client.sendall(response_json.encode('utf-8'))
-                            except json.JSONDecodeError:
-                                pass
-                        else:
-                            App.Console.PrintMessage("Client disconnected\n")
-                            self.client.close()
-                            self.client = None
-                            self.buffer = b''
-                    except BlockingIOError:
-                        pass
-                    except Exception as e:
-                        App.Console.PrintError(f"Error receiving data: {str(e)}\n")
-                        self.client.close()
-                        self.client = None
-                        self.buffer = b''
-                        
-                except Exception as e:
-                    App.Console.PrintError(f"Error with client: {str(e)}\n")
-                    if self.client:
-                        self.client.close()
-                        self.client = None
-                    self.buffer = b''
-                    
+            messages = self._read_client(client)
         except Exception as e:
-            App.Console.PrintError(f"Server error: {str(e)}\n")
+            App.Console.PrintError(f"Error with client: {str(e)}\n")
+            self._close_client(client)
+            return
+        if messages:
+            received = time.perf_counter()
+            client.commands.extend((message, received) for message in messages)
+            if client not in self.ready_clients:
+                self.ready_clients.append(client)
+            self._schedule_drain()
+
+    def _read_client(self, client):
+        """Read everything available from a client and return the complete messages"""
+        messages = []
+        while not client.closed:
+            try:
+                data = client.socket.recv(RECV_CHUNK_SIZE)
+            except BlockingIOError:
+                break
+            if not data:
+                App.Console.PrintMessage("Client disconnected\n")
+                self._close_client(client)
+                return []
+            self.metrics.bytes_received += len(data)
+            try:
+                started = time.perf_counter()
+                decoded = client.decoder.feed(data)
+                if decoded:
+                    share = (time.perf_counter() - started) / len(decoded)
+                    for message in decoded:
+                        self.metrics.observe(self.metrics.label(message), "decode", share)
+                messages.extend(decoded)
+            except (ProtocolError, ValueError) as e:
+                App.Console.PrintError(f"Protocol error: {str(e)}\n")
+                client.commands.clear()
+                client.queue({"status": "error", "message": str(e)})
+                client.close_when_flushed = True
+                client.notifier.setEnabled(False)
+                self._write_pending(client)
+                return []
+        return messages
+
+    def _schedule_drain(self):
+        if not self.drain_scheduled:
+            self.drain_scheduled = True
+            QtCore.QTimer.singleShot(0, self._drain_queue)
+
+    def _next_client(self):
+        """Pick the client whose command runs next.
+
+        Clients are served round-robin, except that a client whose next
+        command is read-only goes before the others. Commands of a single
+        client always run in the order they were sent.
+        """
+        for client in self.ready_clients:
+            if is_read_only(client.commands[0][0]):
+                self.ready_clients.remove(client)
+                return client
+        return self.ready_clients.popleft()
+
+    def _drain_queue(self):
+        """Run queued commands on the GUI thread for at most one time slice"""
+        self.drain_scheduled = False
+        deadline = time.perf_counter() + DRAIN_TIME_SLICE
+        served = []
+        while self.ready_clients and time.perf_counter() < deadline:
+            client = self._next_client()
+            command, received = client.commands.popleft()
+            if not is_read_only(command):
+                # Do not hold back finished responses while a possibly
+                # long-running command executes.
+                self._flush(served)
+            name = self.metrics.label(command)
+            self.metrics.observe(name, "queue", time.perf_counter() - received)
+            response = self._dispatch(command)
+            if client.closed:
+                continue
+            if isinstance(command, dict) and command.get("type") == "hello" and response["status"] == "success":
+                self._negotiate(client, response["result"])
+            client.queue(response, lambda encode, send, name=name: self._sent(name, encode, send))
+            if client not in served:
+                served.append(client)
+            if client.commands:
+                self.ready_clients.append(client)
+        self._flush(served)
+        if self.ready_clients:
+            self._schedule_drain()
+
+    def _negotiate(self, client, hello):
+        """Enable the capabilities agreed on in a hello exchange"""
+        capabilities = set(hello["capabilities"])
+        if not client.is_local:
+            capabilities.discard("shm")
+        hello["capabilities"] = sorted(capabilities)
+        client.decoder.capabilities = capabilities
+        client.decoder.compression = next(
+            (name for name in ("zstd", "zlib") if name in capabilities), None)
+        client.decoder.shared_buffers = self.shared_buffers
+
+    def _flush(self, clients):
+        for client in clients:
+            self._write_pending(client)
+
+    def _dispatch(self, command):
+        name = self.metrics.label(command)
+        self.metrics.context_time = 0.0
+        started = time.perf_counter()
+        response = self.execute_command(command)
+        elapsed = time.perf_counter() - started
+        context_time = self.metrics.context_time
+        if context_time:
+            self.metrics.observe(name, "context", context_time)
+        self.metrics.observe(name, "exec", elapsed - context_time)
+        self.metrics.record(name, response)
+        if isinstance(command, dict) and "id" in command:
+            response["id"] = command["id"]
+        return response
+
+    def _sent(self, name, encode, send):
+        self.metrics.observe(name, "encode", encode)
+        self.metrics.observe(name, "send", send)
+
+    def _write_pending(self, client):
+        """Write queued output without blocking.
+
+        Writing stops when the socket buffer is full or after
+        WRITE_TIME_SLICE; the write notifier then resumes it from the Qt
+        event loop, so FreeCAD stays responsive while large responses go
+        out.
+        """
+        deadline = time.perf_counter() + WRITE_TIME_SLICE
+        while not client.closed:
+            if not client.write_buffer:
+                client.write_buffer = client.next_output()
+                if not client.write_buffer:
+                    break
+            try:
+                sent = client.socket.send(client.write_buffer)
+                self.metrics.bytes_sent += sent
+            except BlockingIOError:
+                client.write_notifier.setEnabled(True)
+                return
+            except OSError as e:
+                App.Console.PrintError(f"Error sending to client: {str(e)}\n")
+                self._close_client(client)
+                return
+            client.write_buffer = client.write_buffer[sent:]
+            if time.perf_counter() > deadline:
+                client.write_notifier.setEnabled(True)
+                return
+        if client.closed:
+            return
+        client.write_notifier.setEnabled(False)
+        if client.close_when_flushed:
+            self._close_client(client)
+
+    def _close_client(self, client):
+        if client.closed:
+            return
+        client.closed = True
+        self._release_notifier(client.notifier)
+        self._release_notifier(client.write_notifier)
+        client.notifier = None
+        client.write_notifier = None
+        client.socket.close()
+        client.commands.clear()
+        client.outgoing.clear()
+        client.write_buffer = memoryview(b'')
+        if client in self.clients:
+            self.clients.remove(client)
+        if client in self.ready_clients:
+            self.ready_clients.remove(client)
 
     def execute_command(self, command):
         try:
@@ -106,8 +2103,28 @@ class FreeCADMCPServer:
             params = command.get("params", {})
             
             handlers = {
+                "hello": self.handle_hello,
+                "get_context": self.handle_get_context,
+                "get_cache_stats": self.handle_get_cache_stats,
                 "send_command": self.handle_send_command,
-                "run_script": self.handle_run_script
+                "run_script": self.handle_run_script,
+                "batch": self.handle_batch,
+                "flush_recompute": self.handle_flush_recompute,
+                "register_function": self.handle_register_function,
+                "call_function": self.handle_call_function,
+                "create_session": self.handle_create_session,
+                "close_session": self.handle_close_session,
+                "list_sessions": self.handle_list_sessions,
+                "submit_job": self.handle_submit_job,
+                "get_job": self.handle_get_job,
+                "cancel_job": self.handle_cancel_job,
+                "list_jobs": self.handle_list_jobs,
+                "compute": self.handle_compute,
+                "bulk_query": self.handle_bulk_query,
+                "bulk_update": self.handle_bulk_update,
+                "tessellate": self.handle_tessellate,
+                "release_buffers": self.handle_release_buffers,
+                "get_metrics": self.handle_get_metrics
             }
             
             handler = handlers.get(cmd_type)
@@ -128,53 +2145,570 @@ class FreeCADMCPServer:
             traceback.print_exc()
             return {"status": "error", "message": str(e)}
 
-    def handle_send_command(self, command, get_context=True):
-        """Handle a send_command request with document context"""
+    def handle_hello(self, protocol=None, capabilities=None, **kwargs):
+        """Handle the protocol handshake sent by a client after connecting
+
+        Returns the capabilities offered by the client that the server
+        supports; they are enabled for the rest of the connection. Of the
+        compression algorithms, only the best one both sides have is kept.
+        """
+        agreed = SERVER_CAPABILITIES & set(capabilities or [])
+        if "zstd" in agreed:
+            agreed.discard("zlib")
+        return {
+            "server": "freecad-mcp",
+            "protocol": PROTOCOL_VERSION,
+            "capabilities": sorted(agreed)
+        }
+
+    def handle_get_context(self, since=None, fields=None, filters=None, cursor=None, limit=None):
+        """Handle a get_context request"""
+        return self.get_document_context(since, fields, filters, cursor, limit)
+
+    def handle_get_cache_stats(self):
+        """Handle a get_cache_stats request"""
+        return {
+            "shape_properties": self.shape_cache.stats(),
+            "tessellation": self.mesh_cache.stats(),
+            "shared_buffers": self.shared_buffers.stats(),
+            "code": self.code_cache.stats(),
+            "functions": sorted(self.functions),
+            "compute": self.compute_pool.stats()
+        }
+
+    def handle_bulk_query(self, objects=None, filters=None, fields=("position", "rotation", "bbox"),
+                          document=None):
+        """Handle a bulk_query request: placement and shape data in columns
+
+        Returns the object names and one packed float64 array per field,
+        with a row per object. Rotations are quaternions (x, y, z, w).
+        Rows of objects lacking the property are NaN.
+        """
+        doc = App.getDocument(document) if document else App.ActiveDocument
+        if doc is None:
+            raise ValueError("No active document")
+        unknown = [field for field in fields if field not in BULK_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown bulk_query fields: {', '.join(unknown)}")
+        if objects is None:
+            selected = doc.Objects
+        else:
+            selected = [doc.getObject(name) for name in objects]
+            missing = [name for name, obj in zip(objects, selected) if obj is None]
+            if missing:
+                raise ValueError(f"Objects not found: {', '.join(missing)}")
+        if filters:
+            matches = self._object_filter(doc, filters)
+            selected = [obj for obj in selected if matches(obj)]
+        nan = float("nan")
+        columns = {field: [] for field in fields}
+        needs_shape = any(field not in ("position", "rotation") for field in fields)
+        for obj in selected:
+            placement = getattr(obj, "Placement", None)
+            shape = self.shape_cache.get(obj) if needs_shape and hasattr(obj, "Shape") else None
+            for field, values in columns.items():
+                if field == "position" and placement is not None:
+                    base = placement.Base
+                    values.extend((base.x, base.y, base.z))
+                elif field == "rotation" and placement is not None:
+                    values.extend(placement.Rotation.Q)
+                elif field == "bbox" and shape and shape["bound_box"]:
+                    values.extend(shape["bound_box"])
+                elif field == "center_of_mass" and shape and shape["center_of_mass"]:
+                    values.extend(shape["center_of_mass"])
+                elif field in ("volume", "area") and shape and shape[field] is not None:
+                    values.append(shape[field])
+                else:
+                    values.extend([nan] * BULK_FIELDS[field])
+        result = {"count": len(selected), "names": [obj.Name for obj in selected]}
+        for field, values in columns.items():
+            width = BULK_FIELDS[field]
+            dims = [len(selected)] if width == 1 else [len(selected), width]
+            result[field] = PackedArray(values, "<f8", dims)
+        return result
+
+    def handle_bulk_update(self, names, position=None, rotation=None, property_name=None, values=None,
+                           atomic=False, defer_recompute=False, document=None):
+        """Handle a bulk_update request: set placements or a property of many objects
+
+        position (x, y, z) and rotation (quaternion x, y, z, w) hold one row
+        per name, as nested lists, a flat list or a packed array; either can
+        be omitted to keep the current value. Alternatively property_name
+        and values set one property per object. All updates run in one
+        transaction followed by one recompute. Returns a packed uint8
+        status per object (UPDATE_OK, UPDATE_NOT_FOUND, UPDATE_FAILED).
+
+        Inside a batch the updates join the batch's transaction, since
+        opening another one would commit the batch's earlier operations;
+        with atomic, the old values are then restored by hand on failure.
+        """
+        doc = App.getDocument(document) if document else App.ActiveDocument
+        if doc is None:
+            raise ValueError("No active document")
+        count = len(names)
+        if position is None and rotation is None and property_name is None:
+            raise ValueError("Nothing to update: pass position, rotation or property_name")
+        if position is not None:
+            position = read_rows(position, 3, count)
+        if rotation is not None:
+            rotation = read_rows(rotation, 4, count)
+        if property_name is not None and (values is None or len(values) != count):
+            raise ValueError("values must hold one value per name")
+        status = array.array("B", [UPDATE_OK]) * count
+        errors = []
+        nested = self.recompute.depth > 0
+        previous = []
+        if not nested:
+            doc.openTransaction("MCP bulk update")
+        try:
+            for index, name in enumerate(names):
+                obj = doc.getObject(name)
+                if obj is None:
+                    status[index] = UPDATE_NOT_FOUND
+                    continue
+                try:
+                    if position is not None or rotation is not None:
+                        placement = obj.Placement
+                        if position is not None:
+                            i = index * 3
+                            base = App.Vector(position[i], position[i + 1], position[i + 2])
+                        else:
+                            base = placement.Base
+                        if rotation is not None:
+                            i = index * 4
+                            rot = App.Rotation(rotation[i], rotation[i + 1], rotation[i + 2], rotation[i + 3])
+                        else:
+                            rot = placement.Rotation
+                        if nested:
+                            previous.append((obj, "Placement", placement))
+                        obj.Placement = App.Placement(base, rot)
+                    if property_name is not None:
+                        if nested:
+                            previous.append((obj, property_name, getattr(obj, property_name)))
+                        setattr(obj, property_name, values[index])
+                except Exception as e:
+                    status[index] = UPDATE_FAILED
+                    if len(errors) < MAX_UPDATE_ERRORS:
+                        errors.append({"index": index, "name": name, "error": str(e)})
+        finally:
+            failed = count - status.count(UPDATE_OK)
+            if nested:
+                if failed and atomic:
+                    for obj, prop, value in reversed(previous):
+                        setattr(obj, prop, value)
+            elif failed and atomic:
+                doc.abortTransaction()
+            else:
+                doc.commitTransaction()
+        # An aborted update leaves recomputes deferred by earlier commands pending.
+        if not (failed and atomic):
+            self.recompute.request(doc)
+        self._finish_recompute(defer_recompute)
+        return {
+            "updated": 0 if failed and atomic else count - failed,
+            "failed": failed,
+            "status": PackedArray(status, "|u1"),
+            "errors": errors
+        }
+
+    def handle_tessellate(self, objects=None, linear_deflection=0.1, angular_deflection=None,
+                          filters=None, document=None):
+        """Handle a tessellate request: mesh buffers of the selected objects
+
+        Returns per object a packed float32 vertex array (n x 3) and a
+        packed uint32 triangle index array (m x 3). Meshes are cached per
+        object revision and deflection.
+        """
+        doc = App.getDocument(document) if document else App.ActiveDocument
+        if doc is None:
+            raise ValueError("No active document")
+        if objects is None:
+            selected = [obj for obj in doc.Objects if hasattr(obj, "Shape")]
+        else:
+            selected = [doc.getObject(name) for name in objects]
+            missing = [name for name, obj in zip(objects, selected) if obj is None or not hasattr(obj, "Shape")]
+            if missing:
+                raise ValueError(f"No shape objects named: {', '.join(missing)}")
+        if filters:
+            matches = self._object_filter(doc, filters)
+            selected = [obj for obj in selected if matches(obj)]
+        meshes = []
+        errors = []
+        for obj in selected:
+            key = (doc.Name, obj.Name, self.tracker.object_revision(obj), linear_deflection, angular_deflection)
+            mesh = self.mesh_cache.get(key)
+            cached = mesh is not None
+            if not cached:
+                if obj.Shape.isNull():
+                    continue
+                try:
+                    mesh = tessellate_shape(obj.Shape, linear_deflection, angular_deflection)
+                except Exception as e:
+                    errors.append({"name": obj.Name, "error": str(e)})
+                    continue
+                self.mesh_cache.put(key, mesh)
+            vertices, indices = mesh
+            meshes.append({
+                "name": obj.Name,
+                "vertices": vertices,
+                "indices": indices,
+                "cached": cached
+            })
+        return {
+            "meshes": meshes,
+            "errors": errors
+        }
+
+    def handle_get_metrics(self, reset=False):
+        """Handle a get_metrics request: counters and per-command phase timings"""
+        metrics = self.metrics.snapshot(len(self.clients))
+        if reset:
+            self.metrics.reset()
+        return metrics
+
+    def handle_release_buffers(self, paths):
+        """Handle a release_buffers request for shared buffers a client has mapped"""
+        return {
+            "released": self.shared_buffers.release(paths)
+        }
+
+    def handle_send_command(self, command, get_context=True, since=None,
+                            fields=None, filters=None, cursor=None, limit=None,
+                            defer_recompute=False, session=None, profile=False,
+                            coalesce_recompute=None):
+        """Handle a send_command request with document context
+
+        With profile, the command and its recompute run under cProfile,
+        see ScriptProfiler. See _coalesce for coalesce_recompute.
+        """
+        profiler = ScriptProfiler(profile)
         try:
             # Execute the command
-            exec(command, {"App": App, "Gui": Gui})
+            coalesce = self._coalesce(coalesce_recompute, defer_recompute)
+            if session:
+                namespace = self._script_namespace(session, coalesce)
+            else:
+                namespace = {"App": DeferredApp(self.recompute) if coalesce else App, "Gui": Gui}
+            with profiler:
+                with self.recompute.deferred():
+                    exec(self.code_cache.compile(command), namespace)
+                self._finish_recompute(defer_recompute)
             
             # Get document context if requested
             context = {}
             if get_context:
-                context = self.get_document_context()
+                context = self.get_document_context(since, fields, filters, cursor, limit)
             
-            return {
+            result = {
                 "command_result": "success",
                 "context": context
             }
         except Exception as e:
-            return {
+            result = {
                 "command_result": "error",
                 "error": str(e),
                 "traceback": traceback.format_exc()
             }
+        if profiler.enabled:
+            result["profile"] = profiler.report()
+        return result
+
+    def handle_run_script(self, script, defer_recompute=False, session=None, profile=False,
+                          coalesce_recompute=None):
+        """Handle a run_script request
 
-    def handle_run_script(self, script):
-        """Handle a run_script request"""
+        With session, the script runs in that session's namespace, so the
+        imports and variables of earlier scripts of the session are kept.
+        With profile, the script and its recompute run under cProfile, see
+        ScriptProfiler. See _coalesce for coalesce_recompute.
+        """
+        profiler = ScriptProfiler(profile)
         try:
-            # Create a new local namespace for the script
-            namespace = {
-                "App": App,
-                "Gui": Gui,
-                "doc": App.ActiveDocument
-            }
+            # Create a new local namespace for the script, or reuse the session's
+            namespace = self._script_namespace(session, self._coalesce(coalesce_recompute, defer_recompute))
             
             # Execute the script
-            exec(script, namespace)
+            with profiler:
+                with self.recompute.deferred():
+                    exec(self.code_cache.compile(script), namespace)
+                self._finish_recompute(defer_recompute)
             
-            return {
+            result = {
                 "script_result": "success"
             }
         except Exception as e:
-            return {
+            result = {
                 "script_result": "error",
                 "error": str(e),
                 "traceback": traceback.format_exc()
             }
+        if profiler.enabled:
+            result["profile"] = profiler.report()
+        return result
+
+    def handle_register_function(self, name, source):
+        """Handle a register_function request
+
+        source is executed once and must define a function called name,
+        which call_function can then invoke without resending the code.
+        """
+        namespace = self._script_namespace()
+        exec(self.code_cache.compile(source, f"<mcp-function {name}>"), namespace)
+        function = namespace.get(name)
+        if not callable(function):
+            raise ValueError(f"Source does not define a function named {name}")
+        self.functions[name] = function
+        return {
+            "registered": name
+        }
+
+    def handle_call_function(self, name, args=None, kwargs=None, defer_recompute=False,
+                             coalesce_recompute=None):
+        """Handle a call_function request for a function registered earlier"""
+        function = self.functions.get(name)
+        if function is None:
+            raise ValueError(f"Unknown function: {name}")
+        if isinstance(getattr(function, "__globals__", None), dict):
+            # Rebind App and doc for this call, also picking up the current
+            # active document
+            self._bind_namespace(function.__globals__, self._coalesce(coalesce_recompute, defer_recompute))
+        try:
+            with self.recompute.deferred():
+                value = function(*(args or []), **(kwargs or {}))
+            self._finish_recompute(defer_recompute)
+            return {
+                "function_result": "success",
+                "value": json_safe(value)
+            }
+        except Exception as e:
+            return {
+                "function_result": "error",
+                "error": str(e),
+                "traceback": traceback.format_exc()
+            }
+
+    def _script_namespace(self, session=None, coalesce=False):
+        namespace = self.sessions.get(session).namespace if session else {}
+        return self._bind_namespace(namespace, coalesce)
 
-    def get_document_context(self):
-        """Get comprehensive information about the current document state"""
+    def _bind_namespace(self, namespace, coalesce):
+        """Set App, Gui and doc in a script namespace
+
+        With coalesce, App and doc are proxies whose recompute() calls are
+        deferred to the end of the command; otherwise they are the real
+        module and document, so a script can read its results right after
+        recomputing.
+        """
+        if coalesce:
+            namespace.update({
+                "App": DeferredApp(self.recompute),
+                "Gui": Gui,
+                "doc": self.recompute.wrap(App.ActiveDocument)
+            })
+        else:
+            namespace.update({
+                "App": App,
+                "Gui": Gui,
+                "doc": App.ActiveDocument
+            })
+        return namespace
+
+    def _coalesce(self, coalesce_recompute, defer_recompute):
+        """Whether a command coalesces the recomputes its code requests
+
+        coalesce_recompute decides when given. By default commands only
+        coalesce inside a batch, or when their recompute is deferred.
+        """
+        if coalesce_recompute is not None:
+            return bool(coalesce_recompute)
+        return self.recompute.coalescing or bool(defer_recompute)
+
+    def handle_create_session(self, name=None, idle_timeout=SESSION_IDLE_TIMEOUT):
+        """Handle a create_session request"""
+        session = self.sessions.create(name, idle_timeout)
+        return {
+            "session": session.name,
+            "idle_timeout": session.idle_timeout
+        }
+
+    def handle_close_session(self, name):
+        """Handle a close_session request"""
+        return {
+            "closed": self.sessions.close(name)
+        }
+
+    def handle_list_sessions(self):
+        """Handle a list_sessions request"""
+        return {
+            "sessions": self.sessions.info(),
+            "evicted": self.sessions.evicted
+        }
+
+    def handle_submit_job(self, script, session=None):
+        """Handle a submit_job request: start a script in the background
+
+        Returns immediately with the job id; see JobManager for how the
+        script is run in steps.
+        """
+        job = self.jobs.submit(script, session)
+        return job.info()
+
+    def handle_get_job(self, job_id):
+        """Handle a get_job request"""
+        return self.jobs.get(job_id).info()
+
+    def handle_cancel_job(self, job_id):
+        """Handle a cancel_job request"""
+        return self.jobs.cancel(job_id).info()
+
+    def handle_list_jobs(self):
+        """Handle a list_jobs request"""
+        return {
+            "jobs": [
+                {"job_id": job.id, "status": job.status, "progress": job.progress}
+                for job in self.jobs.jobs.values()
+            ]
+        }
+
+    def handle_compute(self, op, objects=None, params=None, output=None, document=None):
+        """Handle a compute request: run a geometry operation in a worker process
+
+        The shapes of the named objects are sent to the ComputePool as BREP.
+        Returns a job; when the worker replies, a resulting shape is added
+        to the document as a Part::Feature labelled output.
+        """
+        doc = App.getDocument(document) if document else App.ActiveDocument
+        if doc is None:
+            raise ValueError("No active document")
+        shapes = []
+        for name in objects or []:
+            obj = doc.getObject(name)
+            if obj is None or not hasattr(obj, "Shape"):
+                raise ValueError(f"No shape object named {name}")
+            shapes.append(obj.Shape.exportBrepToString())
+        request = {"op": op, "shapes": shapes, "params": params or {}}
+        job = self.jobs.track()
+        job.future = self.compute_pool.submit(
+            request, lambda reply: self._merge_compute(job, doc.Name, output, reply))
+        return job.info()
+
+    def _merge_compute(self, job, document, output, reply):
+        if job.done:
+            return
+        if "error" in reply:
+            self.jobs.complete(job, error=reply["error"], traceback=reply.get("traceback"))
+            return
+        result = {"value": reply.get("result")}
+        try:
+            if output and reply.get("shape"):
+                import Part
+                doc = App.getDocument(document)
+                shape = Part.Shape()
+                shape.importBrepFromString(reply["shape"])
+                doc.openTransaction("MCP compute")
+                try:
+                    obj = doc.addObject("Part::Feature", "Compute")
+                    obj.Label = output
+                    obj.Shape = shape
+                finally:
+                    doc.commitTransaction()
+                result["object"] = obj.Name
+        except Exception as e:
+            self.jobs.complete(job, error=str(e), traceback=traceback.format_exc())
+            return
+        self.jobs.complete(job, result)
+
+    def handle_flush_recompute(self):
+        """Handle a flush_recompute request: run the deferred recomputes now"""
+        return {
+            "recomputed": self.recompute.flush()
+        }
+
+    def _finish_recompute(self, defer_recompute):
+        # Commands nested in a batch leave the flush to the batch.
+        if not defer_recompute and not self.recompute.depth:
+            self.recompute.flush()
+
+    def handle_batch(self, operations, stop_on_error=True, atomic=False, get_context=False,
+                     defer_recompute=False, since=None, fields=None, filters=None, cursor=None,
+                     limit=None):
+        """Handle a batch request: run several operations in one transaction
+
+        Each operation is a command of its own ({"type": ..., "params": ...}).
+        The recomputes requested by the operations are coalesced into one
+        after the last operation. With atomic, the transaction is aborted if
+        an operation fails.
+        """
+        doc = App.ActiveDocument
+        was_pending = False
+        if doc:
+            was_pending = self.recompute.is_pending(doc)
+            doc.openTransaction("MCP batch")
+        results = []
+        failed = False
+        try:
+            with self.recompute.deferred(coalesce=True):
+                self._run_batch(operations, stop_on_error, results)
+            failed = any(operation_failed(response) for response in results)
+        finally:
+            if doc:
+                if failed and atomic:
+                    doc.abortTransaction()
+                else:
+                    doc.commitTransaction()
+        if doc:
+            if failed and atomic:
+                # Drop only the recomputes the aborted operations requested.
+                if not was_pending:
+                    self.recompute.discard(doc)
+            else:
+                self.recompute.request(doc)
+        self._finish_recompute(defer_recompute)
+        batch = {
+            "batch_result": "error" if failed else "success",
+            "results": results
+        }
+        if get_context:
+            batch["context"] = self.get_document_context(since, fields, filters, cursor, limit)
+        return batch
+
+    def _run_batch(self, operations, stop_on_error, results):
+        failed = False
+        for operation in operations:
+            if failed and stop_on_error:
+                results.append({"status": "skipped"})
+                continue
+            if not isinstance(operation, dict) or operation.get("type") == "batch":
+                response = {"status": "error", "message": "Invalid batch operation"}
+            else:
+                if operation.get("type") == "send_command":
+                    # The batch returns a single context at the end.
+                    operation = dict(operation, params=dict(operation.get("params", {}), get_context=False))
+                response = self.execute_command(operation)
+            results.append(response)
+            failed = failed or operation_failed(response)
+
+    def get_document_context(self, since=None, fields=None, filters=None, cursor=None, limit=None):
+        """Get comprehensive information about the current document state
+
+        When since is a revision token from an earlier context of the same
+        document, only the objects added, modified or removed after it are
+        returned. Otherwise a full snapshot is returned.
+
+        fields restricts each object to the listed OBJECT_FIELDS. filters is
+        a dict with optional "type" (TypeId or list of them), "label" (glob
+        pattern) and "group" (name or label of a group whose members are
+        returned) keys. A full snapshot returns at most limit objects; pass
+        the returned next_cursor as cursor to get the following page. Deltas
+        are not paged, cursor and limit only apply to full snapshots.
+        """
+        started = time.perf_counter()
+        try:
+            return self._build_context(since, fields, filters, cursor, limit)
+        finally:
+            self.metrics.context_time += time.perf_counter() - started
+
+    def _build_context(self, since, fields, filters, cursor, limit):
         doc = App.ActiveDocument
         if not doc:
             return {
@@ -190,50 +2724,113 @@ class FreeCADMCPServer:
             "object_count": len(doc.Objects)
         }
 
-        # Objects info
-        objects = []
-        for obj in doc.Objects:
-            obj_info = {
-                "name": obj.Name,
-                "label": obj.Label,
-                "type": obj.TypeId,
-                "visibility": obj.ViewObject.Visibility if hasattr(obj, "ViewObject") else None
+        if fields is not None:
+            unknown = set(fields) - set(OBJECT_FIELDS)
+            if unknown:
+                raise ValueError(f"Unknown object fields: {sorted(unknown)}")
+            fields = set(fields) | {"name"}
+        start = page_argument(cursor, "cursor", 0) if cursor is not None else 0
+        limit = page_argument(limit, "limit", 1) if limit is not None else None
+        matches = self._object_filter(doc, filters or {})
+
+        changes = self.tracker.changes_since(doc, since) if since else None
+        if changes is not None:
+            added, modified, removed = changes
+            context = {
+                "document": doc_info,
+                "mode": "delta",
+                "since": since,
+                "added": self._objects_info(doc, added, matches, fields),
+                "modified": self._objects_info(doc, modified, matches, fields),
+                "removed": removed
             }
-            
-            # Add placement if available
-            if hasattr(obj, "Placement"):
-                pos = obj.Placement.Base
-                rot = obj.Placement.Rotation
-                obj_info["placement"] = {
-                    "position": [float(pos.x), float(pos.y), float(pos.z)],
-                    "rotation": [float(rot.Axis.x), float(rot.Axis.y), float(rot.Axis.z), float(rot.Angle)]
-                }
-            
-            # Add shape properties if available
-            if hasattr(obj, "Shape"):
-                shape = obj.Shape
-                obj_info["shape"] = {
-                    "type": shape.ShapeType,
-                    "volume": float(shape.Volume) if hasattr(shape, "Volume") else None,
-                    "area": float(shape.Area) if hasattr(shape, "Area") else None
-                }
-            
-            objects.append(obj_info)
-
-        # View state
-        view_info = None
-        if Gui.ActiveDocument:
-            cam = Gui.ActiveDocument.ActiveView.getCameraNode()
-            view_info = {
-                "camera_type": cam.getTypeId(),
-                "camera_position": [float(x) for x in cam.position.getValue()],
-                "camera_orientation": [float(x) for x in cam.orientation.getValue()]
+        else:
+            objects = [obj for obj in doc.Objects if matches(obj)]
+            end = len(objects) if limit is None else start + limit
+            context = {
+                "document": doc_info,
+                "mode": "full",
+                "objects": [self._object_info(obj, fields) for obj in objects[start:end]],
+                "total": len(objects),
+                "next_cursor": str(end) if end < len(objects) else None
+            }
+        context["revision"] = self.tracker.token(doc)
+        context["view"] = self._view_info()
+        return context
+
+    def _object_filter(self, doc, filters):
+        """Build a predicate selecting the objects matched by filters"""
+        types = filters.get("type")
+        if isinstance(types, str):
+            types = [types]
+        label = filters.get("label")
+        members = None
+        if filters.get("group"):
+            group = doc.getObject(filters["group"])
+            if group is None:
+                groups = doc.getObjectsByLabel(filters["group"])
+                group = groups[0] if groups else None
+            if group is None:
+                raise ValueError(f"Group not found: {filters['group']}")
+            members = set()
+            pending = list(getattr(group, "Group", []))
+            while pending:
+                member = pending.pop()
+                if member.Name not in members:
+                    members.add(member.Name)
+                    pending.extend(getattr(member, "Group", []))
+
+        def matches(obj):
+            if types is not None and obj.TypeId not in types:
+                return False
+            if label is not None and not fnmatch.fnmatchcase(obj.Label, label):
+                return False
+            if members is not None and obj.Name not in members:
+                return False
+            return True
+        return matches
+
+    def _objects_info(self, doc, names, matches, fields=None):
+        objects = []
+        for name in names:
+            obj = doc.getObject(name)
+            if obj is not None and matches(obj):
+                objects.append(self._object_info(obj, fields))
+        return objects
+
+    def _object_info(self, obj, fields=None):
+        wanted = fields or OBJECT_FIELDS
+        obj_info = {"name": obj.Name}
+        if "label" in wanted:
+            obj_info["label"] = obj.Label
+        if "type" in wanted:
+            obj_info["type"] = obj.TypeId
+        if "visibility" in wanted:
+            obj_info["visibility"] = obj.ViewObject.Visibility if hasattr(obj, "ViewObject") else None
+        
+        # Add placement if available
+        if "placement" in wanted and hasattr(obj, "Placement"):
+            pos = obj.Placement.Base
+            rot = obj.Placement.Rotation
+            obj_info["placement"] = {
+                "position": [float(pos.x), float(pos.y), float(pos.z)],
+                "rotation": [float(rot.Axis.x), float(rot.Axis.y), float(rot.Axis.z), float(rot.Angle)]
             }
+        
+        # Add shape properties if available
+        if "shape" in wanted and hasattr(obj, "Shape"):
+            obj_info["shape"] = self.shape_cache.get(obj)
+        
+        return obj_info
 
+    def _view_info(self):
+        if not Gui.ActiveDocument:
+            return None
+        cam = Gui.ActiveDocument.ActiveView.getCameraNode()
         return {
-            "document": doc_info,
-            "objects": objects,
-            "view": view_info
+            "camera_type": cam.getTypeId(),
+            "camera_position": [float(x) for x in cam.position.getValue()],
+            "camera_orientation": [float(x) for x in cam.orientation.getValue()]
         }
 
 class FreeCADMCPPanel:
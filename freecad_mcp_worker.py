@@ -0,0 +1,103 @@
+"""Headless geometry worker for the FreeCAD MCP server.
+
+Run under FreeCADCmd by the server's ComputePool. Reads one JSON request
+per line from stdin and writes one reply per request to stdout. Shapes
+travel as BREP strings, so the worker never needs the GUI document.
+FreeCADCmd may print its own messages to stdout, so replies are prefixed
+with WORKER_MARKER and every other line is ignored by the server.
+"""
+import json
+import sys
+import traceback
+
+import Part
+
+# Prefix of reply lines on stdout
+WORKER_MARKER = "FCMP-WORKER "
+
+def load_shape(brep):
+    shape = Part.Shape()
+    shape.importBrepFromString(brep)
+    return shape
+
+def shape_properties(shape):
+    """Volume, area, bounding box and center of mass of a shape"""
+    properties = {"type": shape.ShapeType}
+    for key, attr in (("volume", "Volume"), ("area", "Area")):
+        try:
+            properties[key] = float(getattr(shape, attr))
+        except Exception:
+            properties[key] = None
+    try:
+        box = shape.BoundBox
+        properties["bound_box"] = [box.XMin, box.YMin, box.ZMin, box.XMax, box.YMax, box.ZMax]
+    except Exception:
+        properties["bound_box"] = None
+    try:
+        center = shape.CenterOfMass
+        properties["center_of_mass"] = [center.x, center.y, center.z]
+    except Exception:
+        properties["center_of_mass"] = None
+    return properties
+
+def boolean(shapes, params, operation):
+    base, tools = shapes[0], shapes[1:]
+    if not tools:
+        raise ValueError(f"{operation} needs at least two shapes")
+    shape = getattr(base, operation)(tools)
+    if params.get("refine"):
+        shape = shape.removeSplitter()
+    return shape_properties(shape), shape
+
+def properties(shapes, params):
+    return [shape_properties(shape) for shape in shapes], None
+
+def tessellate(shapes, params):
+    tolerance = float(params.get("tolerance", 0.1))
+    meshes = []
+    for shape in shapes:
+        points, triangles = shape.tessellate(tolerance)
+        meshes.append({
+            "vertices": [[p.x, p.y, p.z] for p in points],
+            "triangles": [list(t) for t in triangles]
+        })
+    return meshes, None
+
+def script(shapes, params):
+    namespace = {"Part": Part, "shapes": shapes, "params": params, "result": None, "shape": None}
+    exec(params["script"], namespace)
+    return namespace["result"], namespace["shape"]
+
+OPERATIONS = {
+    "fuse": lambda shapes, params: boolean(shapes, params, "fuse"),
+    "cut": lambda shapes, params: boolean(shapes, params, "cut"),
+    "common": lambda shapes, params: boolean(shapes, params, "common"),
+    "properties": properties,
+    "tessellate": tessellate,
+    "script": script
+}
+
+def handle(request):
+    operation = OPERATIONS.get(request["op"])
+    if operation is None:
+        raise ValueError(f"Unknown compute operation: {request['op']}")
+    shapes = [load_shape(brep) for brep in request.get("shapes", [])]
+    result, shape = operation(shapes, request.get("params") or {})
+    reply = {"result": result}
+    if shape is not None:
+        reply["shape"] = shape.exportBrepToString()
+    return reply
+
+def main():
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            reply = handle(json.loads(line))
+        except Exception as e:
+            reply = {"error": str(e), "traceback": traceback.format_exc()}
+        sys.stdout.write(WORKER_MARKER + json.dumps(reply) + "\n")
+        sys.stdout.flush()
+
+if __name__ == "__main__":
+    main()
@@ -1,58 +1,605 @@
-from typing import Any, Dict
-import socket
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+import array
+import asyncio
+import base64
 import json
-from mcp.server.fastmcp import FastMCP
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+from mcp.server.fastmcp import Context, FastMCP
 
 # Initialize FastMCP server
 mcp = FastMCP("freecad-bridge")
 
 # Constants
-FREECAD_HOST = 'localhost'
-FREECAD_PORT = 9876
+FREECAD_HOST = os.environ.get('FREECAD_HOST', 'localhost')
+FREECAD_PORT = int(os.environ.get('FREECAD_PORT', '9876'))
+# Unix domain socket of the FreeCAD server. When set, it is tried first
+# and TCP is only used when it cannot be reached.
+FREECAD_SOCKET = os.environ.get('FREECAD_MCP_SOCKET')
+CONNECT_TIMEOUT = 5.0
+HANDSHAKE_TIMEOUT = 5.0
+# When to ask FreeCAD for compressed frames: "auto" (only for remote
+# hosts, where bandwidth matters more than CPU), "always" or "never"
+COMPRESSION = os.environ.get('FREECAD_MCP_COMPRESSION', 'auto')
+# Seconds to wait for a reply before giving up on a request, so a stuck
+# FreeCAD never hangs the whole MCP session. Long work belongs in jobs.
+# 0 waits forever. FreeCAD keeps running a command that timed out.
+REQUEST_TIMEOUT = float(os.environ.get('FREECAD_MCP_REQUEST_TIMEOUT', '120')) or None
+# Seconds between status polls while waiting for a job
+JOB_POLL_INTERVAL = 0.25
+# Commands without side effects, so they can be sent again when the
+# connection drops before their reply arrives. Keep in sync with
+# READ_ONLY_COMMANDS in freecad_mcp.py.
+READ_ONLY_COMMANDS = {"hello", "get_context", "get_cache_stats", "list_sessions", "get_job", "list_jobs",
+                      "bulk_query", "release_buffers", "get_metrics"}
+# File every command sent to FreeCAD is appended to, as JSON lines, so
+# real sessions can be replayed with freecad_loadgen.py
+TRACE_FILE = os.environ.get('FREECAD_MCP_TRACE')
+
+# Wire protocol, keep in sync with FreeCADMCPServer in freecad_mcp.py.
+# Every message is a frame: magic, protocol version, flags, payload
+# length, followed by a UTF-8 JSON payload. Large messages are streamed
+# as several frames, all but the last one flagged with FLAG_MORE.
+PROTOCOL_MAGIC = b'FCMP'
+PROTOCOL_VERSION = 1
+FRAME_HEADER = struct.Struct('!4sBBI')
+FLAG_MORE = 0x01
+# The payload is a JSON_LENGTH prefix, the JSON document and the raw bytes
+# of the packed arrays it references. Requested with the "binary" capability.
+FLAG_BINARY = 0x02
+JSON_LENGTH = struct.Struct('!I')
+CAPABILITIES = ["binary"]
+# Hosts for which the "shm" capability is requested: FreeCAD then hands
+# over large arrays as shared memory files that the bridge maps instead
+# of sending their bytes over the socket.
+SHM_HOSTS = ("localhost", "127.0.0.1", "::1")
+# Whether to ask for "shm": "auto" (on SHM_HOSTS and Unix sockets) or
+# "never", e.g. when the bridge runs in a sandbox that does not see
+# FreeCAD's /dev/shm
+SHARED_MEMORY = os.environ.get('FREECAD_MCP_SHM', 'auto')
+# Compressed frame payloads, requested with the "zlib" or "zstd" capability
+FLAG_ZLIB = 0x04
+FLAG_ZSTD = 0x08
+COMPRESS_THRESHOLD = 4096
+ZLIB_LEVEL = 1
+ZSTD_LEVEL = 3
+MAX_FRAME_SIZE = 512 * 1024 * 1024
+# array typecodes of the dtypes used in packed arrays
+ARRAY_TYPECODES = {"<f8": "d", "<f4": "f", "<u4": "I", "<i4": "i", "|u1": "B"}
+
+class ProtocolError(Exception):
+    """Raised when FreeCAD answers with data that violates the wire protocol."""
+
+def encode_frame(payload: bytes, flags: int = 0) -> bytes:
+    """Prefix a payload with a frame header."""
+    return FRAME_HEADER.pack(PROTOCOL_MAGIC, PROTOCOL_VERSION, flags, len(payload)) + payload
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """Read one complete frame and return its flags and payload."""
+    header = await reader.readexactly(FRAME_HEADER.size)
+    magic, version, flags, length = FRAME_HEADER.unpack(header)
+    if magic != PROTOCOL_MAGIC:
+        raise ProtocolError("Bad frame magic from FreeCAD")
+    if version > PROTOCOL_VERSION:
+        raise ProtocolError(f"Unsupported protocol version {version}")
+    return flags, await reader.readexactly(length)
+
+def compress_frame(payload: bytes, compression: Optional[str]) -> Tuple[bytes, int]:
+    """Compress a frame payload; returns the data to send and its flag."""
+    if compression is None or len(payload) < COMPRESS_THRESHOLD:
+        return payload, 0
+    if compression == "zstd":
+        data, flag = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(payload), FLAG_ZSTD
+    else:
+        data, flag = zlib.compress(payload, ZLIB_LEVEL), FLAG_ZLIB
+    if len(data) >= len(payload):
+        return payload, 0
+    return data, flag
+
+def decompress_frame(payload: bytes, flags: int) -> bytes:
+    """Undo compress_frame."""
+    if flags & FLAG_ZSTD:
+        if zstandard is None:
+            raise ProtocolError("zstd frame received but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(payload, max_output_size=MAX_FRAME_SIZE)
+    if flags & FLAG_ZLIB:
+        return zlib.decompress(payload)
+    return payload
+
+async def read_message(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """Read the frames of one message and return its flags and reassembled payload."""
+    parts = []
+    message_flags = 0
+    while True:
+        flags, payload = await read_frame(reader)
+        parts.append(decompress_frame(payload, flags))
+        message_flags |= flags
+        if not flags & FLAG_MORE:
+            return message_flags & FLAG_BINARY, b''.join(parts)
+
+def map_shared_buffer(path: str) -> memoryview:
+    """Map a shared memory file written by FreeCAD, read-only."""
+    with open(path, "rb") as f:
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+def unpack_array(info: Dict[str, Any], attachments: Optional[memoryview],
+                 shared: Optional[Dict[str, memoryview]] = None) -> Any:
+    """Turn a packed array descriptor into a numpy array or a memoryview.
+
+    Without numpy the result is a memoryview of the right shape, which
+    numpy.asarray() accepts later without copying. Arrays in shared memory
+    are views of the mapped file; the mapping stays valid after FreeCAD
+    removes the file.
+    """
+    if "data" in info:
+        data = memoryview(base64.b64decode(info["data"]))
+    elif "shm" in info:
+        if shared is None:
+            shared = {}
+        if info["shm"] not in shared:
+            shared[info["shm"]] = map_shared_buffer(info["shm"])
+        data = shared[info["shm"]][info["offset"]:info["offset"] + info["nbytes"]]
+    else:
+        data = attachments[info["offset"]:info["offset"] + info["nbytes"]]
+    dtype, shape = info["dtype"], info["shape"]
+    if numpy is not None:
+        return numpy.frombuffer(data, dtype=dtype).reshape(shape)
+    if sys.byteorder == "big":
+        values = array.array(ARRAY_TYPECODES[dtype], data.tobytes())
+        values.byteswap()
+        data = memoryview(values).cast('B')
+    if 0 in shape:
+        return data.cast(ARRAY_TYPECODES[dtype])
+    return data.cast(ARRAY_TYPECODES[dtype], shape)
+
+def decode_message(flags: int, payload: bytes,
+                   shared: Optional[Dict[str, memoryview]] = None) -> Dict[str, Any]:
+    """Parse a message payload, unpacking any packed arrays it contains.
+
+    The shared memory files mapped on the way are added to shared, so the
+    caller can release them. A shared memory file that cannot be mapped
+    turns the message into an error response, rather than failing the
+    connection.
+    """
+    attachments = None
+    if flags & FLAG_BINARY:
+        (length,) = JSON_LENGTH.unpack_from(payload)
+        attachments = memoryview(payload)[JSON_LENGTH.size + length:]
+        payload = payload[JSON_LENGTH.size:JSON_LENGTH.size + length]
+
+    errors: List[str] = []
+
+    def object_hook(value: Dict[str, Any]) -> Any:
+        if "__ndarray__" in value:
+            info = value["__ndarray__"]
+            try:
+                return unpack_array(info, attachments, shared)
+            except (OSError, ValueError) as e:
+                if "shm" not in info:
+                    raise
+                errors.append(f"Cannot map shared buffer {info['shm']}: {e}")
+                if shared is not None:
+                    # Still released, so FreeCAD deletes the file right away
+                    shared.setdefault(info["shm"], memoryview(b""))
+                return None
+        return value
+    message = json.loads(payload, object_hook=object_hook)
+    if errors:
+        return {"id": message.get("id"), "status": "error",
+                "message": errors[0] + "; set FREECAD_MCP_SHM=never if FreeCAD's /dev/shm is not shared"}
+    return message
+
+def encode_message(message: Dict[str, Any], binary: bool) -> Tuple[int, bytes]:
+    """Serialize a request, packing numpy arrays, array.arrays and memoryviews.
+
+    Returns the frame flags and payload. With binary, arrays travel as raw
+    bytes in a FLAG_BINARY payload, otherwise as base64.
+    """
+    attachments: List[bytes] = []
+    offset = 0
+
+    def pack(value: Any) -> Any:
+        nonlocal offset
+        if numpy is not None and isinstance(value, numpy.ndarray):
+            if value.dtype.str not in ARRAY_TYPECODES:
+                value = value.astype("<f8")
+            value = numpy.ascontiguousarray(value, dtype=value.dtype.newbyteorder("<"))
+            dtype, shape, data = value.dtype.str, list(value.shape), value.tobytes()
+        elif isinstance(value, (array.array, memoryview)):
+            typecodes = {code: dtype for dtype, code in ARRAY_TYPECODES.items()}
+            view = memoryview(value)
+            if view.format not in typecodes:
+                raise TypeError(f"Unsupported array format: {view.format}")
+            values = array.array(view.format, view.tobytes())
+            if sys.byteorder == "big":
+                values.byteswap()
+            dtype, shape, data = typecodes[view.format], list(view.shape), values.tobytes()
+        else:
+            raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+        info: Dict[str, Any] = {"dtype": dtype, "shape": shape}
+        if binary:
+            info["offset"] = offset
+            info["nbytes"] = len(data)
+            attachments.append(data)
+            offset += len(data)
+        else:
+            info["data"] = base64.b64encode(data).decode("ascii")
+        return {"__ndarray__": info}
+
+    text = json.dumps(message, default=pack).encode("utf-8")
+    if not attachments:
+        return 0, text
+    return FLAG_BINARY, b"".join([JSON_LENGTH.pack(len(text)), text] + attachments)
+
+def to_json(value: Any) -> Any:
+    """json.dumps default for the arrays returned by unpack_array."""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class FreeCADConnection:
+    """Long-lived connection to the FreeCAD MCP server.
+
+    The socket is opened lazily, reused across tool calls and
+    re-established automatically when FreeCAD is restarted. Every request
+    carries an id, so any number of requests can be in flight at once;
+    a background task matches responses to their callers.
+    """
+
+    def __init__(self, host: str = FREECAD_HOST, port: int = FREECAD_PORT,
+                 socket_path: Optional[str] = FREECAD_SOCKET):
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.transport: Optional[str] = None
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.lock = asyncio.Lock()
+        self.server_info: Dict[str, Any] = {}
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.reader_task: Optional[asyncio.Task] = None
+        self.release_tasks: Set[asyncio.Task] = set()
+        self.next_id = 0
+
+    def is_healthy(self) -> bool:
+        """Return True if the pooled connection can be reused."""
+        return (
+            self.writer is not None
+            and not self.writer.is_closing()
+            and self.reader_task is not None
+            and not self.reader_task.done()
+        )
+
+    async def connect(self) -> None:
+        """Open a fresh connection, dropping any previous one."""
+        await self.close()
+        self.reader, self.writer = await self._open()
+        self.server_info = {}
+        self.pending = {}
+        self.reader_task = asyncio.create_task(self._read_loop(self.reader, self.pending))
+        try:
+            response = await asyncio.wait_for(
+                self._send_many([{
+                    "type": "hello",
+                    "params": {"protocol": PROTOCOL_VERSION, "capabilities": self.capabilities()}
+                }])[0],
+                timeout=HANDSHAKE_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            await self.close()
+            raise ProtocolError(
+                "FreeCAD did not answer the protocol handshake; update the FreeCAD MCP addon"
+            )
+        if response.get("status") != "success":
+            await self.close()
+            raise ProtocolError(f"Handshake rejected: {response.get('message')}")
+        self.server_info = response["result"]
+
+    async def _open(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """Open the Unix domain socket if configured, falling back to TCP."""
+        if self.socket_path and hasattr(asyncio, "open_unix_connection"):
+            try:
+                streams = await asyncio.wait_for(
+                    asyncio.open_unix_connection(self.socket_path),
+                    timeout=CONNECT_TIMEOUT
+                )
+                self.transport = "unix"
+                return streams
+            except (OSError, asyncio.TimeoutError):
+                pass
+        streams = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port),
+            timeout=CONNECT_TIMEOUT
+        )
+        self.transport = "tcp"
+        return streams
+
+    def capabilities(self) -> List[str]:
+        """Return the protocol capabilities to request in hello."""
+        local = self.transport == "unix" or self.host in SHM_HOSTS
+        capabilities = CAPABILITIES + (["shm"] if local and SHARED_MEMORY != "never" else [])
+        if COMPRESSION == "always" or (COMPRESSION == "auto" and not local):
+            capabilities += ["zstd", "zlib"] if zstandard is not None else ["zlib"]
+        return capabilities
+
+    @property
+    def compression(self) -> Optional[str]:
+        """Return the compression agreed on with FreeCAD, if any."""
+        capabilities = self.server_info.get("capabilities", [])
+        return next((name for name in ("zstd", "zlib") if name in capabilities), None)
+
+    def _release(self, paths: List[str]) -> None:
+        """Tell FreeCAD in the background that shared buffers were mapped."""
+        task = asyncio.create_task(self.request({"type": "release_buffers", "params": {"paths": paths}}))
+        self.release_tasks.add(task)
+        task.add_done_callback(self.release_tasks.discard)
+
+    async def close(self) -> None:
+        """Close the pooled connection if it is open."""
+        writer = self.writer
+        reader_task = self.reader_task
+        self.reader = None
+        self.writer = None
+        self.reader_task = None
+        if reader_task is not None:
+            reader_task.cancel()
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    async def request(self, command: Dict[str, Any]) -> Dict[str, Any]:
+        """Send a command over the pooled connection and wait for the reply."""
+        return (await self.request_many([command]))[0]
+
+    async def request_many(self, commands: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Pipeline several commands and wait for all their replies.
+
+        All commands are written at once, so a batch of independent
+        requests costs a single round trip.
+        """
+        async with self.lock:
+            reused = self.is_healthy()
+            if not reused:
+                await self.connect()
+            futures = self._send_many(commands)
+            await self._drain()
+        try:
+            return list(await asyncio.gather(*futures))
+        except ConnectionError:
+            # FreeCAD may have run the commands before the connection
+            # dropped, so only commands without side effects are retried.
+            if not reused or not all(command.get("type") in READ_ONLY_COMMANDS for command in commands):
+                raise
+        # The pooled socket went stale (e.g. FreeCAD was restarted),
+        # so retry once on a fresh connection.
+        async with self.lock:
+            if not self.is_healthy():
+                await self.connect()
+            futures = self._send_many(commands)
+            await self._drain()
+        return list(await asyncio.gather(*futures))
+
+    def _send_many(self, commands: List[Dict[str, Any]]) -> List[asyncio.Future]:
+        loop = asyncio.get_running_loop()
+        futures = []
+        frames = []
+        for command in commands:
+            self.next_id += 1
+            future = loop.create_future()
+            self.pending[self.next_id] = future
+            futures.append(future)
+            message = dict(command, id=self.next_id)
+            flags, payload = encode_message(message, "binary" in self.server_info.get("capabilities", []))
+            payload, compressed = compress_frame(payload, self.compression)
+            frames.append(encode_frame(payload, flags | compressed))
+        # A single write keeps the frames of one batch contiguous.
+        self.writer.write(b''.join(frames))
+        return futures
+
+    async def _drain(self) -> None:
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            # The reader task fails the pending requests with the cause.
+            pass
+
+    async def _read_loop(self, reader: asyncio.StreamReader, pending: Dict[int, asyncio.Future]) -> None:
+        error: Exception = ConnectionResetError("FreeCAD closed the connection")
+        try:
+            while True:
+                shared: Dict[str, memoryview] = {}
+                message = decode_message(*await read_message(reader), shared)
+                if shared:
+                    self._release(list(shared))
+                future = pending.pop(message.pop("id", None), None)
+                if future is not None and not future.done():
+                    future.set_result(message)
+        except asyncio.IncompleteReadError:
+            pass
+        except asyncio.CancelledError:
+            error = ConnectionAbortedError("Connection to FreeCAD was closed")
+        except (ConnectionError, OSError, ProtocolError, ValueError) as e:
+            error = ConnectionResetError(f"Connection to FreeCAD lost: {e}")
+        finally:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            pending.clear()
+
+_connection: Optional[FreeCADConnection] = None
+
+def get_connection() -> FreeCADConnection:
+    """Return the shared FreeCAD connection, creating it on first use."""
+    global _connection
+    if _connection is None:
+        _connection = FreeCADConnection()
+    return _connection
+
+def record_trace(commands: List[Dict[str, Any]]) -> None:
+    """Append commands to TRACE_FILE with the time they were sent.
+
+    Tracing is diagnostics only: when the file cannot be written, the error
+    is reported on stderr and the commands are sent anyway.
+    """
+    now = time.time()
+    try:
+        with open(TRACE_FILE, "a", encoding="utf-8") as f:
+            for command in commands:
+                f.write(json.dumps({"t": now, "command": command}, default=to_json) + "\n")
+    except OSError as e:
+        print(f"Cannot write FREECAD_MCP_TRACE file: {e}", file=sys.stderr)
+
+def timeout_message() -> str:
+    """Error message of a request that got no reply within REQUEST_TIMEOUT."""
+    return (f"No reply from FreeCAD after {REQUEST_TIMEOUT} seconds. The command may still complete "
+            "in FreeCAD; check the document before sending it again")
 
 async def send_to_freecad(command: Dict[str, Any]) -> Dict[str, Any]:
     """Send a command to FreeCAD and get the response."""
     try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.connect((FREECAD_HOST, FREECAD_PORT))
-        command_json = json.dumps(command)
-        sock.sendall(command_json.encode('utf-8'))
-        response = sock.recv(4096)
-        sock.close()
-        return json.loads(response.decode('utf-8'))
+        if TRACE_FILE:
+            record_trace([command])
+        return await asyncio.wait_for(get_connection().request(command), REQUEST_TIMEOUT)
+    except asyncio.TimeoutError:
+        return {"status": "error", "message": timeout_message()}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+async def send_many_to_freecad(commands: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Send several independent commands to FreeCAD in one round trip."""
+    try:
+        if TRACE_FILE:
+            record_trace(commands)
+        return await asyncio.wait_for(get_connection().request_many(commands), REQUEST_TIMEOUT)
+    except asyncio.TimeoutError:
+        return [{"status": "error", "message": timeout_message()} for _ in commands]
+    except Exception as e:
+        return [{"status": "error", "message": str(e)} for _ in commands]
+
+def context_params(since: Optional[str], fields: Optional[List[str]], filters: Optional[Dict[str, Any]],
+                   cursor: Optional[str], limit: Optional[int]) -> Dict[str, Any]:
+    """Build the context request parameters shared by send_command and get_context."""
+    return {
+        "since": since,
+        "fields": fields,
+        "filters": filters,
+        "cursor": cursor,
+        "limit": limit
+    }
+
 @mcp.tool()
-async def send_command(command: str) -> str:
+async def send_command(command: str, since: Optional[str] = None, fields: Optional[List[str]] = None,
+                       filters: Optional[Dict[str, Any]] = None, cursor: Optional[str] = None,
+                       limit: Optional[int] = None, session: Optional[str] = None,
+                       profile: Union[bool, Dict[str, Any]] = False,
+                       coalesce_recompute: bool = False) -> str:
     """Send a command to FreeCAD and get document context information.
     
     Args:
         command: Command to execute in FreeCAD
+        session: Name of a script session whose variables the command can use
+        profile: Profile the command, see run_script
+        coalesce_recompute: Coalesce the command's recomputes, see run_script
+        since: Revision token from a previous context; when given, only the
+            objects added, modified or removed since then are returned
+        fields: Object fields to include, any of "label", "type",
+            "visibility", "placement" and "shape" ("name" is always included)
+        filters: Only return matching objects; supports "type" (TypeId or
+            list of TypeIds), "label" (glob pattern) and "group" (name or
+            label of a group whose members are returned)
+        cursor: next_cursor value of a previous page
+        limit: Maximum number of objects per page, at least 1. cursor and
+            limit only page full snapshots; a delta (`since`) is returned whole
     
     Returns:
         JSON string containing:
         - Command execution result
         - Current document information
-        - Active objects and their properties
+        - Active objects and their properties (or the changes since `since`)
+        - Total number of matching objects and the cursor of the next page
+        - Revision token for the next delta request
         - View state
     """
     command_data = {
         "type": "send_command",
-        "params": {
-            "command": command,
-            "get_context": True
-        }
+        "params": dict(
+            context_params(since, fields, filters, cursor, limit),
+            command=command,
+            get_context=True,
+            session=session,
+            profile=profile,
+            coalesce_recompute=coalesce_recompute
+        )
     }
     result = await send_to_freecad(command_data)
     return json.dumps(result, indent=2)
 
 @mcp.tool()
-async def run_script(script: str) -> str:
+async def get_context(since: Optional[str] = None, fields: Optional[List[str]] = None,
+                      filters: Optional[Dict[str, Any]] = None, cursor: Optional[str] = None,
+                      limit: Optional[int] = None) -> str:
+    """Get the current FreeCAD document context without running a command.
+    
+    Args:
+        since: Revision token from a previous context; when given, only the
+            objects added, modified or removed since then are returned
+        fields: Object fields to include, any of "label", "type",
+            "visibility", "placement" and "shape" ("name" is always included)
+        filters: Only return matching objects; supports "type" (TypeId or
+            list of TypeIds), "label" (glob pattern) and "group" (name or
+            label of a group whose members are returned)
+        cursor: next_cursor value of a previous page
+        limit: Maximum number of objects per page, at least 1. cursor and
+            limit only page full snapshots; a delta (`since`) is returned whole
+    
+    Returns:
+        JSON string containing the document information, a page of objects,
+        the cursor of the next page, revision token and view state
+    """
+    command = {
+        "type": "get_context",
+        "params": context_params(since, fields, filters, cursor, limit)
+    }
+    result = await send_to_freecad(command)
+    return json.dumps(result, indent=2)
+
+@mcp.tool()
+async def run_script(script: str, defer_recompute: bool = False, session: Optional[str] = None,
+                     profile: Union[bool, Dict[str, Any]] = False,
+                     coalesce_recompute: bool = False) -> str:
     """Run an arbitrary Python script in FreeCAD context.
     
     Args:
         script: Python script to execute in FreeCAD
+        coalesce_recompute: Turn the script's doc.recompute() calls into a
+            single recompute of the touched objects after the script
+            finishes. The script then cannot read recomputed results, and
+            `doc` and `App` are proxies rather than the real objects
+        defer_recompute: Coalesce, and leave the recompute pending until
+            flush_recompute is called or a later command recomputes
+        session: Name of a script session; its imports and variables are
+            kept between scripts (created on first use)
+        profile: Run the script under cProfile and return a "profile" with
+            the hottest functions and the time spent in native FreeCAD and
+            OpenCASCADE calls versus Python. Either true or a dict with
+            "top" (number of functions, default 20), "sort" ("tottime" or
+            "cumulative") and "stats" (also return the base64 pstats data)
     
     Returns:
         JSON string containing the execution result
@@ -60,12 +607,396 @@ async def run_script(script: str) -> str:
     command = {
         "type": "run_script",
         "params": {
-            "script": script
+            "script": script,
+            "defer_recompute": defer_recompute,
+            "session": session,
+            "profile": profile,
+            "coalesce_recompute": coalesce_recompute or defer_recompute
+        }
+    }
+    result = await send_to_freecad(command)
+    return json.dumps(result, indent=2)
+
+@mcp.tool()
+async def batch(operations: List[Dict[str, Any]], stop_on_error: bool = True, atomic: bool = False) -> str:
+    """Run several operations in FreeCAD in one round trip and one transaction.
+    
+    The document is recomputed once after the last operation.
+    
+    Args:
+        operations: Commands to run in order, each as {"type": "run_script",
+            "params": {"script": ...}} or {"type": "send_command", "params":
+            {"command": ...}}
+        stop_on_error: Skip the remaining operations after the first failure
+        atomic: Undo the whole batch if any operation fails
+    
+    Returns:
+        JSON string containing the overall result, one result per operation
+        and the document context after the batch
+    """
+    command = {
+        "type": "batch",
+        "params": {
+            "operations": operations,
+            "stop_on_error": stop_on_error,
+            "atomic": atomic,
+            "get_context": True
+        }
+    }
+    result = await send_to_freecad(command)
+    return json.dumps(result, indent=2)
+
+@mcp.tool()
+async def register_function(name: str, source: str) -> str:
+    """Register a Python function in FreeCAD once, to be called by name later.
+    
+    Args:
+        name: Name of the function defined by `source`
+        source: Python source defining the function; it can use App, Gui and
+            doc (the document active when the function is registered)
+    
+    Returns:
+        JSON string containing the registration result
+    """
+    command = {
+        "type": "register_function",
+        "params": {
+            "name": name,
+            "source": source
+        }
+    }
+    result = await send_to_freecad(command)
+    return json.dumps(result, indent=2)
+
+@mcp.tool()
+async def call_function(name: str, args: Optional[List[Any]] = None,
+                        kwargs: Optional[Dict[str, Any]] = None, coalesce_recompute: bool = False) -> str:
+    """Call a function registered with register_function.
+    
+    Args:
+        name: Name of the registered function
+        args: Positional arguments
+        kwargs: Keyword arguments
+        coalesce_recompute: Coalesce the function's recomputes, see run_script
+    
+    Returns:
+        JSON string containing the function's return value
+    """
+    command = {
+        "type": "call_function",
+        "params": {
+            "name": name,
+            "args": args or [],
+            "kwargs": kwargs or {},
+            "coalesce_recompute": coalesce_recompute
         }
     }
     result = await send_to_freecad(command)
     return json.dumps(result, indent=2)
 
+@mcp.tool()
+async def create_session(name: Optional[str] = None, idle_timeout: Optional[float] = None) -> str:
+    """Create a script session that keeps its namespace across run_script calls.
+    
+    Args:
+        name: Session name; a random one is generated when omitted
+        idle_timeout: Seconds of inactivity after which FreeCAD drops the session
+    
+    Returns:
+        JSON string containing the session name
+    """
+    params: Dict[str, Any] = {"name": name}
+    if idle_timeout is not None:
+        params["idle_timeout"] = idle_timeout
+    result = await send_to_freecad({"type": "create_session", "params": params})
+    return json.dumps(result, indent=2)
+
+@mcp.tool()
+async def close_session(name: str) -> str:
+    """Close a script session and release its namespace.
+    
+    Args:
+        name: Session name
+    
+    Returns:
+        JSON string telling whether the session existed
+    """
+    result = await send_to_freecad({"type": "close_session", "params": {"name": name}})
+    return json.dumps(result, indent=2)
+
+@mcp.tool()
+async def list_sessions() -> str:
+    """List the open script sessions with their variables and memory use.
+    
+    Returns:
+        JSON string containing one entry per session
+    """
+    result = await send_to_freecad({"type": "list_sessions"})
+    return json.dumps(result, indent=2)
+
+async def wait_for_job(job_id: str, ctx: Context, timeout: float) -> Dict[str, Any]:
+    """Poll a job until it finishes, reporting its progress to the client.
+
+    The job is cancelled if it is still running after timeout seconds.
+    """
+    deadline = asyncio.get_running_loop().time() + timeout
+    get_job_command = {"type": "get_job", "params": {"job_id": job_id}}
+    last_progress = None
+    while True:
+        response = await send_to_freecad(get_job_command)
+        if response.get("status") != "success":
+            return response
+        job = response["result"]
+        if job["status"] in ("succeeded", "failed", "cancelled"):
+            return response
+        if job["progress"] != last_progress:
+            last_progress = job["progress"]
+            await ctx.report_progress(last_progress, 1.0)
+        if asyncio.get_running_loop().time() >= deadline:
+            response = await send_to_freecad({"type": "cancel_job", "params": {"job_id": job_id}})
+            response["timed_out"] = True
+            return response
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+
+@mcp.tool()
+async def bulk_query(objects: Optional[List[str]] = None, filters: Optional[Dict[str, Any]] = None,
+                     fields: Optional[List[str]] = None) -> str:
+    """Get placement and shape data of many objects at once, in columns.
+    
+    Much faster than get_context for thousands of objects. FreeCAD sends
+    the values as packed float64 arrays; through send_to_freecad they
+    arrive as numpy arrays (or memoryviews when numpy is not installed).
+    
+    Args:
+        objects: Names of the objects to query; all objects if omitted
+        filters: Select objects by "type", "label" glob or "group" membership
+        fields: Any of "position" (x, y, z), "rotation" (quaternion x, y, z, w),
+                "bbox" (xmin, ymin, zmin, xmax, ymax, zmax), "center_of_mass",
+                "volume" and "area". Defaults to position, rotation and bbox.
+        
+    Returns:
+        JSON string with the object names and one row per object in each field
+    """
+    params: Dict[str, Any] = {}
+    if objects is not None:
+        params["objects"] = objects
+    if filters is not None:
+        params["filters"] = filters
+    if fields is not None:
+        params["fields"] = fields
+    result = await send_to_freecad({"type": "bulk_query", "params": params})
+    return json.dumps(result, default=to_json)
+
+@mcp.tool()
+async def bulk_update(names: List[str], position: Optional[List[List[float]]] = None,
+                      rotation: Optional[List[List[float]]] = None, property_name: Optional[str] = None,
+                      values: Optional[List[Any]] = None, atomic: bool = False) -> str:
+    """Move or re-parameterize many objects in one call.
+    
+    All updates run in one transaction with a single recompute. Pass
+    position and/or rotation to set placements, or property_name with
+    values to set one property on every object. Through send_to_freecad
+    the rows can also be numpy arrays, which are sent packed.
+    
+    Args:
+        names: Names of the objects to update
+        position: One [x, y, z] row per name
+        rotation: One quaternion [x, y, z, w] row per name
+        property_name: Name of a property to set, e.g. "Length"
+        values: One value of property_name per name
+        atomic: Undo all updates if any of them fails
+        
+    Returns:
+        JSON string with counts, one status per name (0 ok, 1 not found,
+        2 failed) and the error messages of failed updates
+    """
+    params: Dict[str, Any] = {"names": names, "atomic": atomic}
+    for key, value in (("position", position), ("rotation", rotation),
+                       ("property_name", property_name), ("values", values)):
+        if value is not None:
+            params[key] = value
+    result = await send_to_freecad({"type": "bulk_update", "params": params})
+    return json.dumps(result, default=to_json)
+
+@mcp.tool()
+async def tessellate(objects: Optional[List[str]] = None, linear_deflection: float = 0.1,
+                     angular_deflection: Optional[float] = None, filters: Optional[Dict[str, Any]] = None,
+                     include_buffers: bool = False) -> str:
+    """Mesh the shapes of objects into vertex and triangle index buffers.
+    
+    FreeCAD sends the buffers as packed float32 and uint32 arrays and
+    caches them per object revision and deflection, so unchanged shapes
+    are not meshed again. Through send_to_freecad the buffers arrive as
+    numpy arrays (or memoryviews when numpy is not installed).
+    
+    Args:
+        objects: Names of the objects to mesh; all shape objects if omitted
+        linear_deflection: Largest distance between the mesh and the surface
+        angular_deflection: Largest angle between adjacent facets, in radians
+        filters: Select objects by "type", "label" glob or "group" membership
+        include_buffers: Include the vertex and index lists in the result
+                         instead of only their sizes
+        
+    Returns:
+        JSON string with one mesh per object
+    """
+    params: Dict[str, Any] = {"linear_deflection": linear_deflection}
+    for key, value in (("objects", objects), ("angular_deflection", angular_deflection),
+                       ("filters", filters)):
+        if value is not None:
+            params[key] = value
+    result = await send_to_freecad({"type": "tessellate", "params": params})
+    if not include_buffers and result.get("status") == "success":
+        for mesh in result["result"]["meshes"]:
+            mesh["vertex_count"] = len(mesh.pop("vertices"))
+            mesh["triangle_count"] = len(mesh.pop("indices"))
+    return json.dumps(result, default=to_json)
+
+@mcp.tool()
+async def submit_job(script: str, session: Optional[str] = None) -> str:
+    """Start a long-running Python script in FreeCAD as a background job.
+    
+    The call returns a job id right away. The script runs in steps so
+    FreeCAD stays responsive: define `def main(job):` as a generator and
+    `yield` between pieces of work. Yielding a number from 0 to 1 reports
+    progress, as does `job.progress(fraction, message)`. A cancelled job
+    stops at its next yield; `job.cancelled` can also be checked directly.
+    The value returned from main becomes the job result.
+    
+    Args:
+        script: Python code defining main(job), or plain code run in one step
+        session: Optional name of a script session to run the job in
+        
+    Returns:
+        JSON string containing the job id and status
+    """
+    command = {"type": "submit_job", "params": {"script": script}}
+    if session is not None:
+        command["params"]["session"] = session
+    result = await send_to_freecad(command)
+    return json.dumps(result, indent=2)
+
+@mcp.tool()
+async def get_job(job_id: str) -> str:
+    """Get the status, progress and, once finished, the result of a job.
+    
+    Args:
+        job_id: The id returned by submit_job
+        
+    Returns:
+        JSON string containing the job status
+    """
+    result = await send_to_freecad({"type": "get_job", "params": {"job_id": job_id}})
+    return json.dumps(result, indent=2)
+
+@mcp.tool()
+async def cancel_job(job_id: str) -> str:
+    """Cancel a job. Running jobs stop at their next yield.
+    
+    Args:
+        job_id: The id returned by submit_job
+        
+    Returns:
+        JSON string containing the job status
+    """
+    result = await send_to_freecad({"type": "cancel_job", "params": {"job_id": job_id}})
+    return json.dumps(result, indent=2)
+
+@mcp.tool()
+async def list_jobs() -> str:
+    """List the current and recently finished jobs.
+    
+    Returns:
+        JSON string containing the id, status and progress of each job
+    """
+    result = await send_to_freecad({"type": "list_jobs"})
+    return json.dumps(result, indent=2)
+
+@mcp.tool()
+async def run_job(script: str, ctx: Context, timeout: float = 600.0, session: Optional[str] = None) -> str:
+    """Run a script as a job and wait for it, streaming its progress.
+    
+    Takes the same script as submit_job. Progress is reported to the client
+    while waiting. If the job has not finished after `timeout` seconds it
+    is cancelled.
+    
+    Args:
+        script: Python code defining main(job), or plain code run in one step
+        timeout: Seconds to wait before cancelling the job
+        session: Optional name of a script session to run the job in
+        
+    Returns:
+        JSON string containing the final job status and result
+    """
+    command = {"type": "submit_job", "params": {"script": script}}
+    if session is not None:
+        command["params"]["session"] = session
+    response = await send_to_freecad(command)
+    if response.get("status") != "success":
+        return json.dumps(response, indent=2)
+    return json.dumps(await wait_for_job(response["result"]["job_id"], ctx, timeout), indent=2)
+
+@mcp.tool()
+async def compute(op: str, ctx: Context, objects: Optional[List[str]] = None,
+                  params: Optional[Dict[str, Any]] = None, output: Optional[str] = None,
+                  wait: bool = True, timeout: float = 600.0) -> str:
+    """Run a geometry operation in a headless FreeCADCmd worker process.
+    
+    The shapes of the given objects are sent to a pool of worker processes
+    as BREP, so heavy geometry work runs on other cores and FreeCAD stays
+    responsive. The work runs as a job, see get_job and cancel_job.
+    
+    Args:
+        op: One of "fuse", "cut", "common" (first object with the others),
+            "properties" (volume, area, bounding box, center of mass),
+            "tessellate" (params: tolerance) or "script" (params: script,
+            Python code reading `shapes` and `params` and setting `result`
+            and optionally `shape`)
+        objects: Names of the document objects whose shapes are used
+        params: Parameters of the operation, e.g. {"refine": true}
+        output: Label of a new Part::Feature receiving the resulting shape
+        wait: Wait for the result instead of returning the job id
+        timeout: Seconds to wait before cancelling the job
+        
+    Returns:
+        JSON string containing the job, with the operation result once finished
+    """
+    command = {"type": "compute", "params": {"op": op, "objects": objects or [], "params": params or {}}}
+    if output is not None:
+        command["params"]["output"] = output
+    response = await send_to_freecad(command)
+    if not wait or response.get("status") != "success":
+        return json.dumps(response, indent=2)
+    return json.dumps(await wait_for_job(response["result"]["job_id"], ctx, timeout), indent=2)
+
+@mcp.tool()
+async def flush_recompute() -> str:
+    """Recompute the documents whose recompute was deferred.
+    
+    Returns:
+        JSON string containing the number of objects recomputed per document
+    """
+    result = await send_to_freecad({"type": "flush_recompute"})
+    return json.dumps(result, indent=2)
+
+@mcp.tool()
+async def get_metrics(reset: bool = False) -> str:
+    """Get request counters and latency statistics of the FreeCAD server.
+    
+    For each command, the time spent in each phase of a request is given
+    as count, sum, mean, p50, p95, p99 and max seconds. The phases are
+    queue, decode, exec, context (document context collection), encode and
+    send.
+    
+    Args:
+        reset: Reset the counters after reading them
+        
+    Returns:
+        JSON string containing the metrics
+    """
+    result = await send_to_freecad({"type": "get_metrics", "params": {"reset": reset}})
+    return json.dumps(result, indent=2)
+
 if __name__ == "__main__":
     # Initialize and run the server
     mcp.run(transport='stdio')
\ No newline at end of file
@@ -0,0 +1,338 @@
+"""Load generator and soak test client for the FreeCAD MCP server.
+
+Sends a synthetic mix of commands, or replays a trace recorded by the
+bridge (FREECAD_MCP_TRACE), against a running FreeCAD through the same
+FreeCADConnection the bridge uses. Reports latency percentiles and error
+rates per command, and samples FreeCAD's memory and cache sizes over
+time to catch leaks in long sessions.
+
+    python freecad_loadgen.py --duration 600 --concurrency 8 --rate 50
+    python freecad_loadgen.py --trace session.jsonl --speed 2 --output report.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from freecad_bridge import FREECAD_HOST, FREECAD_PORT, FREECAD_SOCKET, REQUEST_TIMEOUT, FreeCADConnection
+
+# Objects created in the load test document for the synthetic commands
+SEED_OBJECTS = 100
+# Default synthetic request mix, as relative weights
+DEFAULT_MIX = "script=4,context=3,command=2,query=2,tessellate=1"
+# Seconds between samples of FreeCAD's memory and cache sizes
+SAMPLE_INTERVAL = 5.0
+
+SETUP_SCRIPT = """
+doc = App.ActiveDocument or App.newDocument("LoadTest")
+for i in range({count}):
+    if doc.getObject(f"LoadBox{{i}}") is None:
+        doc.addObject("Part::Box", f"LoadBox{{i}}")
+doc.recompute()
+"""
+
+def synthetic_command(kind: str, rng: random.Random) -> Dict[str, Any]:
+    """Build one command of the synthetic mix"""
+    name = f"LoadBox{rng.randrange(SEED_OBJECTS)}"
+    if kind == "script":
+        # Create and delete an object, the churn long sessions go through
+        script = "box = doc.addObject('Part::Box')\ndoc.recompute()\ndoc.removeObject(box.Name)"
+        return {"type": "run_script", "params": {"script": script}}
+    if kind == "context":
+        return {"type": "get_context", "params": {"limit": 50, "fields": ["label", "type", "placement"]}}
+    if kind == "command":
+        # Placement returns a copy, so a new one is assigned rather than
+        # changing Placement.Base in place, which would not touch the object
+        command = (f"App.ActiveDocument.getObject('{name}').Placement = "
+                   f"App.Placement(App.Vector({rng.random():.6f}, 0, 0), App.Rotation())")
+        return {"type": "send_command", "params": {"command": command, "get_context": False}}
+    if kind == "query":
+        return {"type": "bulk_query", "params": {"fields": ["position", "bbox"], "filters": {"label": "LoadBox*"}}}
+    if kind == "tessellate":
+        return {"type": "tessellate", "params": {"objects": [name], "linear_deflection": 0.1}}
+    if kind == "ping":
+        return {"type": "run_script", "params": {"script": "pass"}}
+    raise ValueError(f"Unknown synthetic command: {kind}")
+
+SYNTHETIC_KINDS = ("script", "context", "command", "query", "tessellate", "ping")
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for item in mix.split(","):
+        kind, _, weight = item.partition("=")
+        if kind not in SYNTHETIC_KINDS:
+            raise ValueError(f"Unknown synthetic command: {kind}; expected one of {', '.join(SYNTHETIC_KINDS)}")
+        weights[kind] = float(weight or 1)
+    return weights
+
+# A command to send: offset in seconds from the start (None when not
+# timed), label its statistics are reported under, and the command itself
+Request = Tuple[Optional[float], str, Dict[str, Any]]
+
+def synthetic_commands(mix: Dict[str, float], seed: Optional[int]) -> Iterator[Request]:
+    """Endless weighted random commands, without timestamps"""
+    rng = random.Random(seed)
+    kinds, weights = list(mix), list(mix.values())
+    while True:
+        kind = rng.choices(kinds, weights)[0]
+        yield None, kind, synthetic_command(kind, rng)
+
+def trace_commands(path: str, loop: bool) -> Iterator[Request]:
+    """Commands of a trace file with their offsets from the first one.
+
+    Each line is either a command or {"t": time, "command": command} as
+    recorded by the bridge. When looping, offsets keep increasing across
+    passes.
+    """
+    with open(path, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    if not entries:
+        raise ValueError(f"Trace {path} is empty")
+    timed = all("command" in entry and "t" in entry for entry in entries)
+    start = entries[0]["t"] if timed else 0.0
+    span = entries[-1]["t"] - start if timed else 0.0
+    for iteration in itertools.count():
+        for entry in entries:
+            command = entry["command"] if timed else entry.get("command", entry)
+            offset = entry["t"] - start + iteration * span if timed else None
+            yield offset, str(command.get("type")), command
+        if not loop:
+            return
+
+def percentile(ordered: List[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def response_failed(response: Dict[str, Any]) -> bool:
+    """Whether a successful response reports a failed script or command"""
+    result = response.get("result")
+    if not isinstance(result, dict):
+        return False
+    return any(result.get(key) == "error" for key in ("command_result", "script_result", "function_result"))
+
+class LoadStats:
+    """Latencies and outcomes per command type"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.failures: Dict[str, int] = {}
+        self.messages: Dict[str, int] = {}
+
+    def record(self, kind: str, latency: float, response: Dict[str, Any]) -> None:
+        self.latencies.setdefault(kind, []).append(latency)
+        if response.get("status") != "success":
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+            message = str(response.get("message"))[:200]
+            self.messages[message] = self.messages.get(message, 0) + 1
+        elif response_failed(response):
+            self.failures[kind] = self.failures.get(kind, 0) + 1
+
+    def summary(self, latencies: List[float], errors: int, failures: int) -> Dict[str, Any]:
+        ordered = sorted(latencies)
+        count = len(ordered)
+        return {
+            "requests": count,
+            "errors": errors,
+            "failures": failures,
+            "error_rate": errors / count if count else 0.0,
+            "failure_rate": failures / count if count else 0.0,
+            "mean": sum(ordered) / count if count else None,
+            "p50": percentile(ordered, 0.5),
+            "p95": percentile(ordered, 0.95),
+            "p99": percentile(ordered, 0.99),
+            "max": ordered[-1] if ordered else None
+        }
+
+    def report(self) -> Dict[str, Any]:
+        commands = {
+            kind: self.summary(latencies, self.errors.get(kind, 0), self.failures.get(kind, 0))
+            for kind, latencies in sorted(self.latencies.items())
+        }
+        total = self.summary([latency for latencies in self.latencies.values() for latency in latencies],
+                             sum(self.errors.values()), sum(self.failures.values()))
+        return {"total": total, "commands": commands, "error_messages": self.messages}
+
+class MemorySampler:
+    """Periodic samples of FreeCAD's resident memory and cache sizes"""
+
+    def __init__(self, connection: FreeCADConnection, interval: float):
+        self.connection = connection
+        self.interval = interval
+        self.samples: List[Dict[str, Any]] = []
+        self.started = time.monotonic()
+
+    async def sample(self) -> None:
+        try:
+            metrics, caches = await asyncio.wait_for(self.connection.request_many([
+                {"type": "get_metrics"},
+                {"type": "get_cache_stats"}
+            ]), REQUEST_TIMEOUT)
+        except (asyncio.TimeoutError, ConnectionError, OSError) as e:
+            self.samples.append({"time": time.monotonic() - self.started, "error": str(e)})
+            return
+        metrics = metrics.get("result", {})
+        caches = caches.get("result", {})
+        self.samples.append({
+            "time": time.monotonic() - self.started,
+            "resident_memory": metrics.get("resident_memory"),
+            "clients": metrics.get("clients"),
+            "server_requests": sum(metrics.get("requests", {}).values()),
+            "shape_properties": caches.get("shape_properties", {}).get("size"),
+            "tessellation_bytes": caches.get("tessellation", {}).get("bytes"),
+            "shared_buffers": caches.get("shared_buffers", {}).get("open"),
+            "code": caches.get("code", {}).get("size")
+        })
+
+    async def run(self) -> None:
+        while True:
+            await self.sample()
+            await asyncio.sleep(self.interval)
+
+    def report(self) -> Dict[str, Any]:
+        memory = [(s["time"], s["resident_memory"]) for s in self.samples if s.get("resident_memory") is not None]
+        report: Dict[str, Any] = {"samples": self.samples}
+        if len(memory) >= 2:
+            # Least-squares slope, less sensitive to one-off spikes than end minus start
+            n = len(memory)
+            mean_t = sum(t for t, _ in memory) / n
+            mean_m = sum(m for _, m in memory) / n
+            variance = sum((t - mean_t) ** 2 for t, _ in memory)
+            slope = sum((t - mean_t) * (m - mean_m) for t, m in memory) / variance if variance else 0.0
+            report.update({
+                "start_bytes": memory[0][1],
+                "end_bytes": memory[-1][1],
+                "peak_bytes": max(m for _, m in memory),
+                "growth_bytes": memory[-1][1] - memory[0][1],
+                "growth_bytes_per_minute": slope * 60
+            })
+        return report
+
+async def run_load(args: argparse.Namespace) -> Dict[str, Any]:
+    connect = dict(host=args.host, port=args.port, socket_path=args.socket)
+    connections = [FreeCADConnection(**connect) for _ in range(args.connections)]
+    setup = await connections[0].request({"type": "run_script", "params": {"script": SETUP_SCRIPT.format(count=SEED_OBJECTS)}})
+    if setup.get("status") != "success" or response_failed(setup):
+        raise RuntimeError(f"Could not set up the load test document: {setup}")
+
+    if args.trace:
+        source = trace_commands(args.trace, loop=args.duration is not None)
+    else:
+        source = synthetic_commands(parse_mix(args.mix), args.seed)
+    sampler = MemorySampler(FreeCADConnection(**connect), args.sample_interval)
+    stats = LoadStats()
+    slots = asyncio.Semaphore(args.concurrency)
+    tasks = set()
+
+    async def send(connection: FreeCADConnection, kind: str, command: Dict[str, Any]) -> None:
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(connection.request(command), REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            response = {"status": "error", "message": f"No reply after {REQUEST_TIMEOUT} seconds"}
+        except Exception as e:
+            response = {"status": "error", "message": str(e)}
+        stats.record(kind, time.perf_counter() - started, response)
+        slots.release()
+
+    sampler_task = asyncio.create_task(sampler.run())
+    started = time.monotonic()
+    sent = 0
+    for offset, kind, command in source:
+        if args.requests is not None and sent >= args.requests:
+            break
+        if args.duration is not None and time.monotonic() - started >= args.duration:
+            break
+        # Pace by --rate, else by the trace timestamps, else as fast as allowed
+        if args.rate:
+            due = started + sent / args.rate
+        elif offset is not None and not args.no_pacing:
+            due = started + offset / args.speed
+        else:
+            due = None
+        if due is not None:
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await slots.acquire()
+        task = asyncio.create_task(send(connections[sent % len(connections)], kind, command))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        sent += 1
+    if tasks:
+        await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - started
+    sampler_task.cancel()
+    await sampler.sample()
+
+    for connection in connections + [sampler.connection]:
+        await connection.close()
+    report = stats.report()
+    report.update({
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "seconds": elapsed,
+        "throughput": report["total"]["requests"] / elapsed if elapsed else 0.0,
+        "memory": sampler.report()
+    })
+    return report
+
+def format_seconds(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.1f}ms"
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"{report['total']['requests']} requests in {report['seconds']:.1f}s "
+          f"({report['throughput']:.1f}/s)")
+    print(f"{'command':<16}{'requests':>9}{'errors':>8}{'failed':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    rows = list(report["commands"].items()) + [("total", report["total"])]
+    for kind, row in rows:
+        print(f"{kind:<16}{row['requests']:>9}{row['errors']:>8}{row['failures']:>8}"
+              f"{format_seconds(row['p50']):>10}{format_seconds(row['p95']):>10}"
+              f"{format_seconds(row['p99']):>10}{format_seconds(row['max']):>10}")
+    for message, count in report["error_messages"].items():
+        print(f"  {count} x {message}")
+    memory = report["memory"]
+    if "growth_bytes" in memory:
+        print(f"FreeCAD memory: {memory['start_bytes'] / 2 ** 20:.1f} -> {memory['end_bytes'] / 2 ** 20:.1f} MiB "
+              f"(peak {memory['peak_bytes'] / 2 ** 20:.1f} MiB, "
+              f"trend {memory['growth_bytes_per_minute'] / 2 ** 20:+.2f} MiB/min)")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=FREECAD_HOST, help="FreeCAD host (default: FREECAD_HOST)")
+    parser.add_argument("--port", type=int, default=FREECAD_PORT, help="FreeCAD port (default: FREECAD_PORT)")
+    parser.add_argument("--socket", default=FREECAD_SOCKET, help="FreeCAD Unix socket (default: FREECAD_MCP_SOCKET)")
+    parser.add_argument("--trace", help="Replay this trace instead of the synthetic mix")
+    parser.add_argument("--mix", default=DEFAULT_MIX,
+                        help=f"Synthetic mix as kind=weight pairs, kinds: {', '.join(SYNTHETIC_KINDS)}")
+    parser.add_argument("--seed", type=int, help="Random seed of the synthetic mix")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight at most")
+    parser.add_argument("--connections", type=int, default=1,
+                        help="Connections the requests are spread over, one per simulated agent")
+    parser.add_argument("--rate", type=float, help="Requests per second to send (default: as fast as possible)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed factor of trace timestamps")
+    parser.add_argument("--no-pacing", action="store_true", help="Ignore trace timestamps")
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds; traces are looped")
+    parser.add_argument("--requests", type=int, help="Stop after this many requests")
+    parser.add_argument("--sample-interval", type=float, default=SAMPLE_INTERVAL,
+                        help="Seconds between samples of FreeCAD's memory")
+    parser.add_argument("--output", help="Also write the full report, with the memory samples, as JSON")
+    args = parser.parse_args()
+    if args.duration is None and args.requests is None and not args.trace:
+        args.requests = 1000
+
+    try:
+        report = asyncio.run(run_load(args))
+    except (RuntimeError, ValueError, OSError) as e:
+        sys.exit(f"Load test failed: {e}")
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Shared fixtures: a FreeCADMCPServer running on the benchmark stubs.
+
+The stand-in FreeCAD, FreeCADGui and PySide modules of benchmarks/stubs
+make the server importable without FreeCAD, so the wire protocol can be
+tested end to end with the bridge.
+"""
+import os
+import socket
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIR = os.path.dirname(TESTS_DIR)
+sys.path[:0] = [os.path.join(REPOSITORY_DIR, "benchmarks", "stubs"), REPOSITORY_DIR,
+                os.path.join(REPOSITORY_DIR, "src")]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+@pytest.fixture(scope="session")
+def server():
+    """A server listening on a free TCP port, run by the stub Qt event loop"""
+    from PySide import QtCore
+    import freecad_mcp
+
+    QtCore.start_event_loop()
+    server = freecad_mcp.FreeCADMCPServer(host="localhost", port=free_port(), socket_path=None,
+                                          metrics_port=None)
+    QtCore.call_in_event_loop(server.start)
+    assert server.running
+    yield server
+    QtCore.call_in_event_loop(server.stop)
+
+@pytest.fixture
+def execute(server):
+    """Run a command on the event loop thread like a client request and return its result"""
+    from PySide import QtCore
+
+    def execute(command_type, **params):
+        response = QtCore.call_in_event_loop(server.execute_command, {"type": command_type, "params": params})
+        assert response["status"] == "success", response.get("message")
+        return response["result"]
+
+    return execute
+
+@pytest.fixture
+def in_loop():
+    """Call a function on the event loop thread, where the documents live"""
+    from PySide import QtCore
+    return QtCore.call_in_event_loop
@@ -0,0 +1,41 @@
+"""batch: operations in one transaction with one recompute."""
+import FreeCAD as App
+
+def test_batch_stops_on_error(execute, in_loop):
+    in_loop(App.newDocument, "Batch")
+    result = execute("batch", operations=[
+        {"type": "run_script", "params": {"script": "1 / 0"}},
+        {"type": "run_script", "params": {"script": "pass"}}
+    ])
+    assert result["batch_result"] == "error"
+    assert result["results"][1] == {"status": "skipped"}
+
+def test_batch_coalesces_recomputes(server, execute, in_loop):
+    in_loop(App.newDocument, "Batch recompute")
+    requested = server.recompute.requested
+    script = "doc.addObject('Part::Box', 'Box')\ndoc.recompute()"
+    result = execute("batch", operations=[{"type": "run_script", "params": {"script": script}}] * 3)
+    assert result["batch_result"] == "success"
+    # Three deferred recomputes and the batch's own, flushed once
+    assert server.recompute.requested - requested == 4
+    assert server.recompute.pending == {}
+
+def test_aborted_batch_keeps_earlier_deferred_recompute(server, execute, in_loop):
+    doc = in_loop(App.newDocument, "Batch abort")
+    execute("run_script", script="doc.addObject('Part::Box', 'Box')\ndoc.recompute()", defer_recompute=True)
+    assert server.recompute.is_pending(doc)
+    execute("batch", atomic=True, defer_recompute=True,
+            operations=[{"type": "run_script", "params": {"script": "1 / 0"}}])
+    assert server.recompute.is_pending(doc)
+    assert execute("flush_recompute")["recomputed"] == {"Batch abort": 1}
+
+def test_batch_rejects_unknown_parameters(server, in_loop):
+    response = in_loop(server.execute_command, {"type": "batch", "params": {"operations": [], "stop_on_eror": False}})
+    assert response["status"] == "error"
+    assert "stop_on_eror" in response["message"]
+
+def test_batch_context(execute, in_loop):
+    doc = in_loop(App.newDocument, "Batch context")
+    in_loop(doc.addObject, "Part::Box", "Box")
+    result = execute("batch", operations=[], get_context=True, fields=["label"])
+    assert result["context"]["objects"] == [{"name": "Box", "label": "Box"}]
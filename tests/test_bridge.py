@@ -0,0 +1,51 @@
+"""Bridge helpers: tracing and the load generator's synthetic commands."""
+import asyncio
+import random
+import socket
+
+import FreeCAD as App
+import freecad_bridge
+import freecad_loadgen
+
+def test_unwritable_trace_file(server, monkeypatch, tmp_path, capsys):
+    monkeypatch.setattr(freecad_bridge, "TRACE_FILE", str(tmp_path / "missing" / "trace.jsonl"))
+    connection = freecad_bridge.FreeCADConnection(host="localhost", port=server.port, socket_path=None)
+    monkeypatch.setattr(freecad_bridge, "_connection", connection)
+
+    async def send():
+        try:
+            return await freecad_bridge.send_to_freecad({"type": "list_jobs"})
+        finally:
+            await connection.close()
+
+    assert asyncio.run(send())["status"] == "success"
+    assert "Cannot write FREECAD_MCP_TRACE file" in capsys.readouterr().err
+
+def test_synthetic_command_moves_object(execute, in_loop):
+    doc = in_loop(App.newDocument, "Load")
+    in_loop(lambda: [doc.addObject("Part::Box", f"LoadBox{i}") for i in range(freecad_loadgen.SEED_OBJECTS)])
+    command = freecad_loadgen.synthetic_command("command", random.Random(1))
+    result = execute(command["type"], **command["params"])
+    assert result["command_result"] == "success", result
+    assert any(obj.Placement.Base.x != 0 for obj in doc.Objects)
+
+def test_request_timeout(monkeypatch):
+    # A server that accepts connections but never answers
+    with socket.socket() as silent:
+        silent.bind(("localhost", 0))
+        silent.listen()
+        connection = freecad_bridge.FreeCADConnection(host="localhost", port=silent.getsockname()[1],
+                                                      socket_path=None)
+        monkeypatch.setattr(freecad_bridge, "_connection", connection)
+        monkeypatch.setattr(freecad_bridge, "REQUEST_TIMEOUT", 0.2)
+        monkeypatch.setattr(freecad_bridge, "HANDSHAKE_TIMEOUT", 5.0)
+
+        async def send():
+            try:
+                return await freecad_bridge.send_many_to_freecad([{"type": "run_script"}, {"type": "list_jobs"}])
+            finally:
+                await connection.close()
+
+        responses = asyncio.run(send())
+    assert [response["status"] for response in responses] == ["error", "error"]
+    assert "may still complete" in responses[0]["message"]
@@ -0,0 +1,32 @@
+"""bulk_update, on its own and inside a batch."""
+import array
+
+import FreeCAD as App
+
+def test_bulk_update_placements(execute, in_loop):
+    doc = in_loop(App.newDocument, "Bulk")
+    in_loop(lambda: [doc.addObject("Part::Box", name) for name in ("A", "B")])
+    result = execute("bulk_update", names=["A", "Missing", "B"], position=[[1, 2, 3], [0, 0, 0], [4, 5, 6]])
+    assert (result["updated"], result["failed"]) == (2, 1)
+    assert array.array("B", result["status"].data).tolist() == [0, 1, 0]
+    assert list(doc.getObject("B").Placement.Base) == [4.0, 5.0, 6.0]
+
+def test_bulk_update_joins_batch_transaction(execute, in_loop):
+    doc = in_loop(App.newDocument, "Bulk batch")
+    in_loop(doc.addObject, "Part::Box", "A")
+    check = "assert doc.transactionName() == 'MCP batch', doc.transactionName()"
+    result = execute("batch", operations=[
+        {"type": "bulk_update", "params": {"names": ["A"], "position": [[1, 0, 0]]}},
+        {"type": "run_script", "params": {"script": check}}
+    ])
+    assert result["batch_result"] == "success", result["results"]
+
+def test_atomic_bulk_update_in_batch_restores_values(execute, in_loop):
+    doc = in_loop(App.newDocument, "Bulk rollback")
+    in_loop(lambda: [setattr(doc.addObject("Part::Box", name), "Length", 1.0) for name in ("A", "B")])
+    result = execute("batch", operations=[
+        {"type": "bulk_update", "params": {"names": ["A", "B"], "property_name": "Length",
+                                           "values": [2.0, -1.0], "atomic": True}}
+    ])
+    assert result["results"][0]["result"]["updated"] == 0
+    assert doc.getObject("A").Length == 1.0
@@ -0,0 +1,33 @@
+"""Shape property and tessellation caches."""
+import array
+
+import FreeCAD as App
+
+def test_shape_properties_follow_placement(server, in_loop):
+    doc = in_loop(App.newDocument, "Moved")
+    box = in_loop(doc.addObject, "Part::Box", "Box")
+    in_loop(server.shape_cache.get, box)
+    in_loop(setattr, box, "Placement", App.Placement(App.Vector(5, 0, 0)))
+    assert ("Moved", "Box") not in server.shape_cache.entries
+
+def test_tessellation_cached_per_revision(execute, in_loop):
+    doc = in_loop(App.newDocument, "Meshed")
+    box = in_loop(doc.addObject, "Part::Box", "Box")
+    assert [mesh["cached"] for mesh in execute("tessellate")["meshes"]] == [False]
+    assert [mesh["cached"] for mesh in execute("tessellate")["meshes"]] == [True]
+    in_loop(setattr, box, "Shape", App.Shape(2.0))
+    assert [mesh["cached"] for mesh in execute("tessellate")["meshes"]] == [False]
+
+def test_tessellation_of_reopened_document(execute, in_loop):
+    doc = in_loop(App.newDocument, "Reopened mesh")
+    box = in_loop(doc.addObject, "Part::Box", "Box")
+    in_loop(setattr, box, "Shape", App.Shape(3.0))
+    execute("tessellate")
+    in_loop(App.closeDocument, "Reopened mesh")
+    doc = in_loop(App.newDocument, "Reopened mesh")
+    box = in_loop(doc.addObject, "Part::Box", "Box")
+    # Same object revision as the box of the closed document
+    in_loop(setattr, box, "Label", "Box")
+    [mesh] = execute("tessellate")["meshes"]
+    assert mesh["cached"] is False
+    assert max(array.array("f", mesh["vertices"].data)) == 1.0
@@ -0,0 +1,65 @@
+"""ComputePool: worker processes and cancellation."""
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+import freecad_mcp
+
+WORKER = """#!{python}
+import json, sys, time
+for line in sys.stdin:
+    request = json.loads(line)
+    if request["op"] == "hang":
+        time.sleep(1000)
+    print({marker!r} + json.dumps({{"result": request["op"]}}), flush=True)
+"""
+
+@pytest.fixture
+def worker(tmp_path, monkeypatch):
+    if sys.platform == "win32":
+        pytest.skip("the fake worker is a script with a shebang line")
+    path = tmp_path / "worker.py"
+    path.write_text(WORKER.format(python=sys.executable, marker=freecad_mcp.WORKER_MARKER))
+    path.chmod(0o755)
+    monkeypatch.setenv("FREECAD_MCP_WORKER", str(path))
+
+def submit(pool, in_loop, request):
+    done = threading.Event()
+    replies = []
+
+    def callback(reply):
+        replies.append(reply)
+        done.set()
+
+    future = in_loop(pool.submit, request, callback)
+    return future, done, replies
+
+def test_cancel_kills_running_request(worker, server, in_loop):
+    pool = freecad_mcp.ComputePool(size=1)
+    try:
+        hung, _, _ = submit(pool, in_loop, {"op": "hang"})
+        deadline = time.monotonic() + 10
+        while pool.tasks.get(hung, {}).get("process") is None:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        process = pool.tasks[hung]["process"]
+        in_loop(pool.cancel, hung)
+        assert process.wait(10) is not None
+        # The only executor thread is free again
+        _, done, replies = submit(pool, in_loop, {"op": "ok"})
+        assert done.wait(10)
+        assert replies == [{"result": "ok"}]
+    finally:
+        in_loop(pool.shutdown)
+
+def test_shutdown_cancels_queued_requests(worker, server, in_loop):
+    pool = freecad_mcp.ComputePool(size=1)
+    hung, _, _ = submit(pool, in_loop, {"op": "hang"})
+    queued, _, _ = submit(pool, in_loop, {"op": "ok"})
+    in_loop(pool.shutdown)
+    assert queued.cancelled()
+    assert pool.processes == set()
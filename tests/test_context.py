@@ -0,0 +1,54 @@
+"""Document contexts: full snapshots, delta contexts and revision tokens."""
+import FreeCAD as App
+
+def names(objects):
+    return sorted(obj["name"] for obj in objects)
+
+def test_delta_context(execute, in_loop):
+    doc = in_loop(App.newDocument, "Delta")
+    in_loop(lambda: [doc.addObject("Part::Box", name) for name in ("A", "B")])
+    token = execute("get_context")["revision"]
+    in_loop(lambda: (doc.addObject("Part::Box", "C"), doc.removeObject("A")))
+    context = execute("get_context", since=token)
+    assert context["mode"] == "delta"
+    assert names(context["added"]) == ["C"]
+    assert context["removed"] == ["A"]
+
+def test_token_of_closed_document(execute, in_loop):
+    doc = in_loop(App.newDocument, "Reopened")
+    in_loop(lambda: [doc.addObject("Part::Box", name) for name in ("A", "B")])
+    token = execute("get_context")["revision"]
+    in_loop(App.closeDocument, "Reopened")
+    doc = in_loop(App.newDocument, "Reopened")
+    in_loop(lambda: [doc.addObject("Part::Box", name) for name in ("X", "Y", "Z")])
+    context = execute("get_context", since=token)
+    assert context["mode"] == "full"
+    assert names(context["objects"]) == ["X", "Y", "Z"]
+
+def test_delta_context_of_modified_object(execute, in_loop):
+    doc = in_loop(App.newDocument, "Modified")
+    box = in_loop(doc.addObject, "Part::Box", "Box")
+    token = execute("get_context")["revision"]
+    in_loop(setattr, box, "Label", "Renamed")
+    context = execute("get_context", since=token, fields=["label"])
+    assert context["mode"] == "delta"
+    assert context["modified"] == [{"name": "Box", "label": "Renamed"}]
+    assert execute("get_context", since=context["revision"])["modified"] == []
+
+def test_full_context_filters_and_pages(execute, in_loop):
+    doc = in_loop(App.newDocument, "Paged")
+    in_loop(lambda: [doc.addObject("Part::Box", f"Box{i}") for i in range(5)] + [doc.addObject("Part::Cylinder", "Cyl")])
+    first = execute("get_context", filters={"type": "Part::Box"}, limit=3)
+    second = execute("get_context", filters={"type": "Part::Box"}, limit=3, cursor=first["next_cursor"])
+    assert names(first["objects"] + second["objects"]) == [f"Box{i}" for i in range(5)]
+    assert second["next_cursor"] is None
+
+def test_foreign_token_gets_full_snapshot(execute, in_loop):
+    in_loop(App.newDocument, "Foreign")
+    assert execute("get_context", since="not-a-token")["mode"] == "full"
+
+def test_invalid_page_arguments(server, in_loop):
+    in_loop(App.newDocument, "Invalid pages")
+    for params in ({"limit": -1}, {"limit": 0}, {"limit": "ten"}, {"cursor": "-1"}, {"cursor": 1.5}):
+        response = in_loop(server.execute_command, {"type": "get_context", "params": params})
+        assert response["status"] == "error", params
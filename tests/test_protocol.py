@@ -0,0 +1,278 @@
+"""Wire protocol: the server's FrameDecoder, the bridge's read_message and
+round trips between FreeCADConnection and FreeCADMCPServer."""
+import array
+import asyncio
+import json
+import socket
+
+import pytest
+
+import freecad_bridge
+import freecad_mcp
+from freecad_mcp import (FLAG_BINARY, FLAG_MORE, FLAG_ZLIB, FLAG_ZSTD, FRAME_HEADER, JSON_LENGTH,
+                         PROTOCOL_MAGIC, PROTOCOL_VERSION, FrameDecoder, ProtocolError, encode_frame)
+
+def frame(message, flags=0):
+    return encode_frame(json.dumps(message).encode("utf-8"), flags)
+
+def binary_payload(message, *attachments):
+    text = json.dumps(message).encode("utf-8")
+    return b"".join([JSON_LENGTH.pack(len(text)), text] + list(attachments))
+
+# FrameDecoder
+
+def test_single_frame():
+    assert FrameDecoder().feed(frame({"type": "hello"})) == [{"type": "hello"}]
+
+def test_frame_split_byte_by_byte():
+    decoder = FrameDecoder()
+    data = frame({"type": "run_script", "params": {"script": "pass"}})
+    messages = []
+    for i in range(len(data)):
+        messages += decoder.feed(data[i:i + 1])
+        if i < len(data) - 1:
+            assert messages == []
+    assert decoder.legacy is False
+    assert messages == [{"type": "run_script", "params": {"script": "pass"}}]
+
+def test_pipelined_frames():
+    decoder = FrameDecoder()
+    data = b"".join(frame({"id": i}) for i in range(3))
+    # The first chunk ends in the middle of the third frame
+    assert decoder.feed(data[:-5]) == [{"id": 0}, {"id": 1}]
+    assert decoder.feed(data[-5:]) == [{"id": 2}]
+    assert decoder.buffer == bytearray()
+
+def test_message_streamed_in_frames():
+    payload = json.dumps({"script": "x" * 1000}).encode("utf-8")
+    data = (encode_frame(payload[:300], FLAG_MORE) + encode_frame(payload[300:600], FLAG_MORE)
+            + encode_frame(payload[600:]) + frame({"id": 2}))
+    assert FrameDecoder().feed(data) == [{"script": "x" * 1000}, {"id": 2}]
+
+def test_legacy_bare_json():
+    decoder = FrameDecoder()
+    assert decoder.feed(b'{"type": "get_context"}') == [{"type": "get_context"}]
+    assert decoder.legacy is True
+
+def test_legacy_split_inside_braces():
+    decoder = FrameDecoder()
+    # The first chunk ends with "}" but is not a complete object yet
+    assert decoder.feed(b'{"type": "run_script", "params": {"script": "d = {}') == []
+    assert decoder.feed(b'"}}') == [{"type": "run_script", "params": {"script": "d = {}"}}]
+
+def test_legacy_pipelined():
+    decoder = FrameDecoder()
+    assert decoder.feed(b'{"id": 1}{"id": 2}\n {"id": 3} ') == [{"id": 1}, {"id": 2}, {"id": 3}]
+    # Parsing waits for a chunk ending with "}"
+    assert decoder.feed(b'{"id": 4} {"id": ') == []
+    assert decoder.feed(b'5}') == [{"id": 4}, {"id": 5}]
+
+def test_legacy_multibyte_split():
+    data = json.dumps({"label": "部品"}, ensure_ascii=False).encode("utf-8")
+    decoder = FrameDecoder()
+    assert decoder.feed(data[:-3]) == []
+    assert decoder.feed(data[-3:]) == [{"label": "部品"}]
+
+def test_oversize_frame():
+    header = FRAME_HEADER.pack(PROTOCOL_MAGIC, PROTOCOL_VERSION, 0, freecad_mcp.MAX_FRAME_SIZE + 1)
+    with pytest.raises(ProtocolError, match="too large"):
+        # Rejected from the header, without waiting for the payload
+        FrameDecoder().feed(header)
+
+def test_bad_magic_after_frame():
+    decoder = FrameDecoder()
+    assert decoder.feed(frame({"id": 1})) == [{"id": 1}]
+    with pytest.raises(ProtocolError, match="magic"):
+        decoder.feed(b"XXXX" + bytes(FRAME_HEADER.size))
+
+def test_unsupported_version():
+    header = FRAME_HEADER.pack(PROTOCOL_MAGIC, PROTOCOL_VERSION + 1, 0, 2)
+    with pytest.raises(ProtocolError, match="version"):
+        FrameDecoder().feed(header + b"{}")
+
+@pytest.mark.parametrize("compression, flag", [
+    ("zlib", FLAG_ZLIB),
+    pytest.param("zstd", FLAG_ZSTD, marks=pytest.mark.skipif(freecad_mcp.zstandard is None,
+                                                              reason="zstandard is not installed"))
+])
+def test_compressed_frame(compression, flag):
+    message = {"script": "box = 1\n" * 2000}
+    payload, compressed = freecad_mcp.compress_frame(json.dumps(message).encode("utf-8"), compression)
+    assert compressed == flag
+    assert FrameDecoder().feed(encode_frame(payload, compressed)) == [message]
+
+def test_small_frames_are_not_compressed():
+    payload = b'{"id": 1}'
+    assert freecad_mcp.compress_frame(payload, "zlib") == (payload, 0)
+
+def test_compressed_frame_too_large(monkeypatch):
+    payload, flag = freecad_mcp.compress_frame(json.dumps({"data": "x" * 100000}).encode("utf-8"), "zlib")
+    monkeypatch.setattr(freecad_mcp, "MAX_FRAME_SIZE", 50000)
+    with pytest.raises(ProtocolError, match="too large"):
+        FrameDecoder().feed(encode_frame(payload, flag))
+
+def test_bad_compressed_frame():
+    with pytest.raises(ProtocolError, match="zlib"):
+        FrameDecoder().feed(encode_frame(b"not zlib", FLAG_ZLIB))
+
+def test_binary_payload():
+    values = array.array("d", [1.5, -2.0, 3.25])
+    indices = array.array("I", [0, 1, 2])
+    message = {"params": {
+        "values": {"__ndarray__": {"dtype": "<f8", "shape": [3], "offset": 0, "nbytes": 24}},
+        "indices": {"__ndarray__": {"dtype": "<u4", "shape": [3], "offset": 24, "nbytes": 12}}
+    }}
+    data = encode_frame(binary_payload(message, values.tobytes(), indices.tobytes()), FLAG_BINARY)
+    [decoded] = FrameDecoder().feed(data)
+    assert decoded["params"]["values"] == values
+    assert decoded["params"]["indices"] == indices
+
+def test_base64_array():
+    message = {"__ndarray__": {"dtype": "<f4", "shape": [2], "data": "AACAPwAAAEA="}}
+    assert FrameDecoder().feed(frame({"values": message})) == [{"values": array.array("f", [1.0, 2.0])}]
+
+def test_unsupported_dtype():
+    message = {"__ndarray__": {"dtype": "<c16", "shape": [1], "data": ""}}
+    with pytest.raises(ProtocolError, match="dtype"):
+        FrameDecoder().feed(frame({"values": message}))
+
+# Bridge read_message
+
+async def read_all(chunks):
+    """Decode every message the bridge reads from chunks delivered one at a time"""
+    reader = asyncio.StreamReader()
+    messages = []
+
+    async def read():
+        while True:
+            try:
+                messages.append(freecad_bridge.decode_message(*await freecad_bridge.read_message(reader)))
+            except asyncio.IncompleteReadError:
+                return
+
+    task = asyncio.create_task(read())
+    for chunk in chunks:
+        reader.feed_data(chunk)
+        await asyncio.sleep(0)
+    reader.feed_eof()
+    await task
+    return messages
+
+def test_read_message_split_and_pipelined():
+    data = frame({"id": 1}) + frame({"id": 2}) + frame({"id": 3})
+    chunks = [data[i:i + 7] for i in range(0, len(data), 7)]
+    assert asyncio.run(read_all(chunks)) == [{"id": 1}, {"id": 2}, {"id": 3}]
+
+def test_read_message_streamed_and_compressed():
+    message = {"id": 1, "result": "line\n" * 10000}
+    payload = json.dumps(message).encode("utf-8")
+    first, flag = freecad_bridge.compress_frame(payload[:20000], "zlib")
+    assert flag == FLAG_ZLIB
+    data = encode_frame(first, flag | FLAG_MORE) + encode_frame(payload[20000:])
+    assert asyncio.run(read_all([data])) == [message]
+
+def test_read_message_binary():
+    values = array.array("d", [0.5, 1.5, 2.5, 3.5])
+    message = {"id": 7, "result": {"__ndarray__": {"dtype": "<f8", "shape": [2, 2], "offset": 0, "nbytes": 32}}}
+    [decoded] = asyncio.run(read_all([encode_frame(binary_payload(message, values.tobytes()), FLAG_BINARY)]))
+    assert decoded["id"] == 7
+    assert decoded["result"].tolist() == [[0.5, 1.5], [2.5, 3.5]]
+
+def test_read_message_bad_magic():
+    with pytest.raises(freecad_bridge.ProtocolError):
+        asyncio.run(read_all([b"XXXX" + bytes(FRAME_HEADER.size)]))
+
+# Round trips
+
+def connection(server):
+    return freecad_bridge.FreeCADConnection(host="localhost", port=server.port, socket_path=None)
+
+async def round_trip(server, commands):
+    conn = connection(server)
+    try:
+        return await conn.request_many(commands), conn.server_info
+    finally:
+        await conn.close()
+
+ECHO = {"type": "register_function", "params": {"name": "echo", "source": "def echo(value):\n    return value\n"}}
+
+def echo(value):
+    return {"type": "call_function", "params": {"name": "echo", "args": [value]}}
+
+def test_round_trip_pipelined(server):
+    responses, info = asyncio.run(round_trip(server, [ECHO] + [echo(i) for i in range(20)]))
+    assert info["capabilities"] == ["binary", "shm"]
+    assert [response["result"]["value"] for response in responses[1:]] == list(range(20))
+
+def test_round_trip_streamed_response(server):
+    text = "x" * (3 * freecad_mcp.STREAM_CHUNK_SIZE + 17)
+    responses, _ = asyncio.run(round_trip(server, [ECHO, echo(text)]))
+    assert responses[1]["result"]["value"] == text
+
+def test_round_trip_compressed(server, monkeypatch):
+    monkeypatch.setattr(freecad_bridge, "COMPRESSION", "always")
+    text = "Part::Box\n" * 50000
+    responses, info = asyncio.run(round_trip(server, [ECHO, echo(text)]))
+    assert set(info["capabilities"]) & {"zlib", "zstd"}
+    assert responses[1]["result"]["value"] == text
+
+def test_round_trip_binary_arrays(server):
+    from PySide import QtCore
+    import FreeCAD as App
+
+    def build():
+        doc = App.newDocument("Protocol")
+        for i in range(3):
+            doc.addObject("Part::Box", f"Box{i}").Placement = App.Placement(App.Vector(i, 2 * i, 0))
+
+    QtCore.call_in_event_loop(build)
+    total = {"type": "register_function",
+             "params": {"name": "total", "source": "def total(values):\n    return sum(values)\n"}}
+    values = array.array("d", [0.25] * 1000)
+    commands = [
+        total,
+        {"type": "call_function", "params": {"name": "total", "args": [values]}},
+        {"type": "bulk_query", "params": {"document": "Protocol", "fields": ["position"]}}
+    ]
+    responses, _ = asyncio.run(round_trip(server, commands))
+    assert responses[1]["result"]["value"] == 250.0
+    result = responses[2]["result"]
+    assert result["names"] == ["Box0", "Box1", "Box2"]
+    assert result["position"].tolist() == [[0.0, 0.0, 0.0], [1.0, 2.0, 0.0], [2.0, 4.0, 0.0]]
+
+def test_round_trip_legacy_client(server):
+    with socket.create_connection(("localhost", server.port), timeout=5) as sock:
+        sock.sendall(b'{"type": "hello"} {"type": "list_jobs"}')
+        decoder = json.JSONDecoder()
+        data = b""
+        responses = []
+        while len(responses) < 2:
+            data += sock.recv(65536)
+            text = data.decode("utf-8").lstrip()
+            responses = []
+            while text:
+                try:
+                    response, index = decoder.raw_decode(text)
+                except json.JSONDecodeError:
+                    break
+                responses.append(response)
+                text = text[index:].lstrip()
+    assert [response["status"] for response in responses] == ["success", "success"]
+    assert responses[0]["result"]["server"] == "freecad-mcp"
+
+def test_round_trip_oversize_frame(server):
+    async def send_oversize():
+        reader, writer = await asyncio.open_connection("localhost", server.port)
+        try:
+            writer.write(FRAME_HEADER.pack(PROTOCOL_MAGIC, PROTOCOL_VERSION, 0, freecad_mcp.MAX_FRAME_SIZE + 1))
+            await writer.drain()
+            response = freecad_bridge.decode_message(*await freecad_bridge.read_message(reader))
+            # The server closes the connection after the error
+            return response, await reader.read()
+        finally:
+            writer.close()
+
+    response, rest = asyncio.run(send_oversize())
+    assert response["status"] == "error"
+    assert "too large" in response["message"]
+    assert rest == b""
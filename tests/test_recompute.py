@@ -0,0 +1,22 @@
+"""Recompute coalescing and deferral."""
+import FreeCAD as App
+
+SCRIPT = "box = doc.addObject('Part::Box', 'Box')\ndoc.recompute()\ntouched = box.isTouched()"
+
+def test_scripts_recompute_immediately_by_default(server, execute, in_loop):
+    in_loop(App.newDocument, "Immediate")
+    execute("run_script", script=SCRIPT, session="immediate")
+    assert server.sessions.get("immediate").namespace["touched"] is False
+
+def test_coalesced_recompute_runs_after_the_script(server, execute, in_loop):
+    doc = in_loop(App.newDocument, "Coalesced")
+    execute("run_script", script=SCRIPT, session="coalesced", coalesce_recompute=True)
+    assert server.sessions.get("coalesced").namespace["touched"] is True
+    assert not doc.getObject("Box").isTouched()
+
+def test_deferred_recompute_waits_for_flush(server, execute, in_loop):
+    doc = in_loop(App.newDocument, "Deferred")
+    execute("run_script", script=SCRIPT, defer_recompute=True)
+    assert doc.getObject("Box").isTouched()
+    assert execute("flush_recompute")["recomputed"] == {"Deferred": 1}
+    assert not doc.getObject("Box").isTouched()
@@ -0,0 +1,35 @@
+"""Script sessions and background jobs."""
+import time
+
+import FreeCAD as App
+
+def test_session_keeps_variables(execute):
+    execute("create_session", name="kept")
+    execute("run_script", script="import math\nradius = 2", session="kept")
+    execute("run_script", script="area = math.pi * radius ** 2", session="kept")
+    [info] = [session for session in execute("list_sessions")["sessions"] if session["name"] == "kept"]
+    assert info["variables"] == ["area", "math", "radius"]
+    assert execute("close_session", name="kept") == {"closed": True}
+
+def wait_for_job(execute, job_id):
+    deadline = time.monotonic() + 10
+    while True:
+        job = execute("get_job", job_id=job_id)
+        if job["status"] in ("succeeded", "failed", "cancelled"):
+            return job
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+def test_job_runs_in_steps(execute, in_loop):
+    in_loop(App.newDocument, "Jobs")
+    script = "def main(job):\n    for i in range(4):\n        yield (i + 1) / 4\n    return 'done'\n"
+    job = wait_for_job(execute, execute("submit_job", script=script)["job_id"])
+    assert (job["status"], job["result"], job["progress"], job["steps"]) == ("succeeded", "done", 1.0, 5)
+
+def test_job_failure_and_cancel(execute):
+    failed = wait_for_job(execute, execute("submit_job", script="def main(job):\n    raise ValueError('bad')\n")["job_id"])
+    assert (failed["status"], failed["error"]) == ("failed", "bad")
+    endless = "def main(job):\n    while True:\n        yield\n"
+    job_id = execute("submit_job", script=endless)["job_id"]
+    execute("cancel_job", job_id=job_id)
+    assert wait_for_job(execute, job_id)["status"] == "cancelled"